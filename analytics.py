@@ -0,0 +1,370 @@
+"""
+Колоночное хранилище записей времени в памяти для быстрых отчетов.
+
+Для каждой записи хранятся employee_id, department_id (отдел сотрудника),
+check_in (микросекунды от эпохи) и длительность в секундах в компактных типизированных массивах (модуль array).
+Если установлен NumPy, агрегаты считаются векторными операциями над этими
+же массивами без копирования; без NumPy используется обычный цикл.
+
+Хранилище загружается при старте (ANALYTICS_ENABLED) и перед запросом
+дочитывает изменения по updated_at, если с прошлой синхронизации прошло
+больше ANALYTICS_REFRESH_SECONDS. updated_at ставится до фиксации транзакции,
+поэтому строки перечитываются с запасом ANALYTICS_SYNC_OVERLAP_SECONDS до
+последней отметки: изменение, зафиксированное позже более новых, не теряется
+(повторно прочитанные строки заменяют свои же позиции). Удаленные записи
+дочитыванием не видны: если записей в базе стало меньше, чем в хранилище, или
+с полной загрузки прошло ANALYTICS_FULL_RELOAD_SECONDS, хранилище
+перезагружается полностью. Открытые записи тоже хранятся (длительность
+NaN), чтобы каждая запись занимала постоянную позицию в порядке ID.
+
+Проверка результатов против SQL:
+    python analytics.py --start 2024-01-01 --end 2024-12-31
+"""
+import math
+import sys
+import time
+from array import array
+from bisect import bisect_left
+from datetime import datetime, timedelta
+from threading import RLock
+
+from sqlalchemy import func
+
+from models import db, TimeRecord, Employee
+
+try:
+    import numpy as np
+except ImportError:
+    np = None
+
+EPOCH = datetime(1970, 1, 1)
+NO_DEPARTMENT = -1
+LOAD_BATCH_SIZE = 50000
+# Запас перечитывания по updated_at, с; должен превышать самую долгую транзакцию записи
+SYNC_OVERLAP_SECONDS = 60
+# Интервал полной перезагрузки (удаления, скрытые одновременными вставками), с
+FULL_RELOAD_SECONDS = 600
+
+DAY_MICROSECONDS = 86400 * 10 ** 6
+
+def to_microseconds(value):
+    """Наивное время (как хранится в БД) в микросекунды от эпохи"""
+    delta = value - EPOCH
+    return (delta.days * 86400 + delta.seconds) * 10 ** 6 + delta.microseconds
+
+class ColumnarStore:
+    """Колоночное представление таблицы time_records"""
+
+    def __init__(self, sync_overlap=SYNC_OVERLAP_SECONDS, full_reload_interval=FULL_RELOAD_SECONDS):
+        self.lock = RLock()
+        self.sync_overlap = timedelta(seconds=sync_overlap)
+        self.full_reload_interval = full_reload_interval
+        self._reset()
+
+    def _reset(self):
+        self.ids = array('q')
+        self.employee_ids = array('i')
+        self.department_ids = array('i')
+        self.check_ins = array('q')
+        self.durations = array('f')
+        self.employee_departments = {}
+        self.records_synced_at = None
+        self.employees_synced_at = None
+        self.refreshed_at = 0.0
+        self.loaded_at = 0.0
+
+    def __len__(self):
+        return len(self.ids)
+
+    def memory_bytes(self):
+        return sum(
+            column.itemsize * len(column)
+            for column in (self.ids, self.employee_ids, self.department_ids, self.check_ins, self.durations)
+        )
+
+    # Загрузка и синхронизация
+
+    def load(self):
+        """Полная загрузка из базы данных"""
+        with self.lock:
+            self._reset()
+            self._sync_employees()
+            self._sync_records()
+            self.refreshed_at = self.loaded_at = time.monotonic()
+
+    def refresh(self, max_age=0):
+        """Дочитывает изменения, если данные старше max_age секунд"""
+        with self.lock:
+            now = time.monotonic()
+            if now - self.refreshed_at < max_age:
+                return
+            if now - self.loaded_at >= self.full_reload_interval:
+                self.load()
+                return
+            self._sync_employees()
+            self._sync_records()
+            # Одновременные вставки только увеличивают число записей в базе,
+            # поэтому меньшее число означает удаление
+            if db.session.query(func.count(TimeRecord.id)).scalar() < len(self.ids):
+                print("Аналитика: записи удалены, полная перезагрузка")
+                self.load()
+                return
+            self.refreshed_at = time.monotonic()
+
+    def _sync_employees(self):
+        query = db.session.query(Employee.id, Employee.department_id, Employee.updated_at)
+        if self.employees_synced_at is not None:
+            # С запасом: изменения, зафиксированные позже прошлой синхронизации, не теряются
+            query = query.filter(Employee.updated_at >= self.employees_synced_at - self.sync_overlap)
+
+        changed = {}
+        for row in query:
+            department_id = row.department_id if row.department_id is not None else NO_DEPARTMENT
+            if self.employee_departments.get(row.id) != department_id:
+                changed[row.id] = department_id
+            if self.employees_synced_at is None or row.updated_at > self.employees_synced_at:
+                self.employees_synced_at = row.updated_at
+
+        self.employee_departments.update(changed)
+        if changed and len(self.ids):
+            # Перевод сотрудника в другой отдел меняет отдел всех его записей
+            if np is not None:
+                employees = np.frombuffer(self.employee_ids, dtype=np.int32)
+                departments = np.frombuffer(self.department_ids, dtype=np.int32)
+                for employee_id, department_id in changed.items():
+                    departments[employees == employee_id] = department_id
+            else:
+                for index, employee_id in enumerate(self.employee_ids):
+                    if employee_id in changed:
+                        self.department_ids[index] = changed[employee_id]
+
+    def _sync_records(self):
+        query = db.session.query(
+            TimeRecord.id,
+            TimeRecord.employee_id,
+            TimeRecord.check_in,
+            TimeRecord.check_out,
+            TimeRecord.updated_at
+        )
+        if self.records_synced_at is not None:
+            query = query.filter(TimeRecord.updated_at >= self.records_synced_at - self.sync_overlap)
+
+        out_of_order = False
+        for row in query.order_by(TimeRecord.id).yield_per(LOAD_BATCH_SIZE):
+            duration = (row.check_out - row.check_in).total_seconds() if row.check_out else math.nan
+            department_id = self.employee_departments.get(row.employee_id, NO_DEPARTMENT)
+
+            position = bisect_left(self.ids, row.id)
+            if position < len(self.ids) and self.ids[position] == row.id:
+                self.employee_ids[position] = row.employee_id
+                self.department_ids[position] = department_id
+                self.check_ins[position] = to_microseconds(row.check_in)
+                self.durations[position] = duration
+            elif position == len(self.ids):
+                self.ids.append(row.id)
+                self.employee_ids.append(row.employee_id)
+                self.department_ids.append(department_id)
+                self.check_ins.append(to_microseconds(row.check_in))
+                self.durations.append(duration)
+            else:
+                out_of_order = True
+                break
+
+            if self.records_synced_at is None or row.updated_at > self.records_synced_at:
+                self.records_synced_at = row.updated_at
+
+        if out_of_order:
+            # Запись с меньшим ID появилась позже уже загруженных - перечитываем всё
+            print("Аналитика: запись вне порядка ID, полная перезагрузка")
+            self.load()
+
+    # Запросы
+
+    def _mask(self, start_date, end_date, employee_id=None, department_id=None):
+        """Булева маска закрытых записей за период (NumPy)"""
+        check_ins = np.frombuffer(self.check_ins, dtype=np.int64)
+        durations = np.frombuffer(self.durations, dtype=np.float32)
+        mask = (check_ins >= to_microseconds(start_date)) & (check_ins <= to_microseconds(end_date)) & (durations >= 0)
+        if employee_id:
+            mask &= np.frombuffer(self.employee_ids, dtype=np.int32) == employee_id
+        if department_id:
+            mask &= np.frombuffer(self.department_ids, dtype=np.int32) == department_id
+        return mask
+
+    def _rows(self, start_date, end_date, employee_id=None, department_id=None):
+        """Закрытые записи за период без NumPy: (employee_id, department_id, check_in, duration)"""
+        start = to_microseconds(start_date)
+        end = to_microseconds(end_date)
+        for row in zip(self.employee_ids, self.department_ids, self.check_ins, self.durations):
+            if not start <= row[2] <= end or not row[3] >= 0:
+                continue
+            if employee_id and row[0] != employee_id:
+                continue
+            if department_id and row[1] != department_id:
+                continue
+            yield row
+
+    def totals(self, start_date, end_date, employee_id=None, department_id=None):
+        """Сумма часов и количество закрытых записей за период"""
+        with self.lock:
+            if np is not None:
+                mask = self._mask(start_date, end_date, employee_id, department_id)
+                durations = np.frombuffer(self.durations, dtype=np.float32)[mask]
+                return float(durations.sum(dtype=np.float64)), int(mask.sum())
+            total = 0.0
+            count = 0
+            for row in self._rows(start_date, end_date, employee_id, department_id):
+                total += row[3]
+                count += 1
+            return total, count
+
+    def group_totals(self, start_date, end_date, group_by='employee', department_id=None):
+        """
+        Суммы секунд и количество записей по группам: {ключ: (секунды, записи)}.
+        group_by: employee, department (ключ NO_DEPARTMENT - без отдела), date (ключ - дата).
+        """
+        with self.lock:
+            if np is not None:
+                mask = self._mask(start_date, end_date, department_id=department_id)
+                durations = np.frombuffer(self.durations, dtype=np.float32)[mask].astype(np.float64)
+                if group_by == 'employee':
+                    keys = np.frombuffer(self.employee_ids, dtype=np.int32)[mask].astype(np.int64)
+                elif group_by == 'department':
+                    keys = np.frombuffer(self.department_ids, dtype=np.int32)[mask].astype(np.int64)
+                else:
+                    keys = np.frombuffer(self.check_ins, dtype=np.int64)[mask] // DAY_MICROSECONDS
+                if not len(keys):
+                    return {}
+                offset = keys.min()
+                sums = np.bincount(keys - offset, weights=durations)
+                counts = np.bincount(keys - offset)
+                present = np.nonzero(counts)[0]
+                groups = {
+                    int(key + offset): (float(sums[key]), int(counts[key]))
+                    for key in present
+                }
+            else:
+                groups = {}
+                column = {'employee': 0, 'department': 1}.get(group_by)
+                for row in self._rows(start_date, end_date, department_id=department_id):
+                    key = row[column] if column is not None else row[2] // DAY_MICROSECONDS
+                    seconds, count = groups.get(key, (0.0, 0))
+                    groups[key] = (seconds + row[3], count + 1)
+
+        if group_by == 'date':
+            groups = {
+                (EPOCH + timedelta(days=key)).date(): value
+                for key, value in groups.items()
+            }
+        return groups
+
+def init_analytics(app):
+    """Загружает колоночное хранилище при старте, если оно включено"""
+    if not app.config.get('ANALYTICS_ENABLED'):
+        return None
+    if app.config.get('TIME_RECORD_SHARDS'):
+        # Хранилище читает time_records одним потоком по возрастанию ID одной базы
+        print("Аналитика: не поддерживается при шардировании записей, хранилище выключено")
+        return None
+    store = ColumnarStore(
+        sync_overlap=app.config.get('ANALYTICS_SYNC_OVERLAP_SECONDS', SYNC_OVERLAP_SECONDS),
+        full_reload_interval=app.config.get('ANALYTICS_FULL_RELOAD_SECONDS', FULL_RELOAD_SECONDS),
+    )
+    started = time.perf_counter()
+    with app.app_context():
+        store.load()
+        db.session.remove()
+    print(f"Аналитика: загружено {len(store)} записей за {time.perf_counter() - started:.2f} с, "
+          f"{store.memory_bytes() / 1024 / 1024:.1f} МБ, NumPy: {'да' if np is not None else 'нет'}")
+    app.extensions['analytics'] = store
+    return store
+
+def duration_seconds_sql():
+    """Выражение длительности записи в секундах для текущей СУБД"""
+    if db.engine.dialect.name == 'sqlite':
+        return (func.julianday(TimeRecord.check_out) - func.julianday(TimeRecord.check_in)) * 86400
+    return func.extract('epoch', TimeRecord.check_out - TimeRecord.check_in)
+
+def verify(store, start_date, end_date, tolerance_hours=0.01):
+    """
+    Сравнивает итоги по сотрудникам, отделам и дням с SQL.
+    Возвращает список расхождений (пустой, если результаты совпадают).
+    """
+    base = db.session.query(
+        func.sum(duration_seconds_sql()).label('seconds'),
+        func.count(TimeRecord.id).label('record_count')
+    ).join(
+        Employee, TimeRecord.employee_id == Employee.id
+    ).filter(
+        TimeRecord.check_in >= start_date,
+        TimeRecord.check_in <= end_date,
+        TimeRecord.check_out != None
+    )
+
+    expected = {
+        'employee': {
+            row.employee_id: (row.seconds, row.record_count)
+            for row in base.add_columns(TimeRecord.employee_id).group_by(TimeRecord.employee_id)
+        },
+        'department': {
+            (row.department_id if row.department_id is not None else NO_DEPARTMENT): (row.seconds, row.record_count)
+            for row in base.add_columns(Employee.department_id).group_by(Employee.department_id)
+        },
+    }
+    day = func.date(TimeRecord.check_in)
+    expected['date'] = {
+        (row.day if not isinstance(row.day, str) else datetime.fromisoformat(row.day).date()): (row.seconds, row.record_count)
+        for row in base.add_columns(day.label('day')).group_by(day)
+    }
+
+    mismatches = []
+    for group_by, sql_groups in expected.items():
+        groups = store.group_totals(start_date, end_date, group_by=group_by)
+        for key in set(sql_groups) | set(groups):
+            sql_seconds, sql_count = sql_groups.get(key, (0, 0))
+            seconds, count = groups.get(key, (0, 0))
+            if sql_count != count or abs((sql_seconds or 0) - seconds) / 3600 > tolerance_hours:
+                mismatches.append({
+                    'group_by': group_by,
+                    'key': str(key),
+                    'sql': {'total_hours': round((sql_seconds or 0) / 3600, 4), 'record_count': sql_count},
+                    'analytics': {'total_hours': round(seconds / 3600, 4), 'record_count': count},
+                })
+    return mismatches
+
+def main(argv=None):
+    """Загрузка хранилища и сверка с SQL из командной строки"""
+    import argparse
+
+    parser = argparse.ArgumentParser(description='Сверка колоночной аналитики с SQL')
+    parser.add_argument('--start', required=True)
+    parser.add_argument('--end', required=True)
+    args = parser.parse_args(argv)
+
+    start_date = datetime.fromisoformat(args.start)
+    end_date = datetime.fromisoformat(args.end)
+    if len(args.end) == 10:
+        end_date = datetime.combine(end_date.date(), datetime.max.time())
+
+    from app import create_app
+    app = create_app()
+    with app.app_context():
+        store = ColumnarStore()
+        started = time.perf_counter()
+        store.load()
+        print(f"Загружено {len(store)} записей за {time.perf_counter() - started:.2f} с "
+              f"({store.memory_bytes() / 1024 / 1024:.1f} МБ)")
+
+        for group_by in ('employee', 'department', 'date'):
+            started = time.perf_counter()
+            groups = store.group_totals(start_date, end_date, group_by=group_by)
+            print(f"group_by={group_by}: {len(groups)} групп за {(time.perf_counter() - started) * 1000:.1f} мс")
+
+        mismatches = verify(store, start_date, end_date)
+    for mismatch in mismatches:
+        print(f"РАСХОЖДЕНИЕ {mismatch}")
+    print(f"Расхождений с SQL: {len(mismatches)}")
+    return 1 if mismatches else 0
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -1,84 +1,145 @@
 import os
+import json
 from flask import Flask, jsonify, send_from_directory
 from flask_cors import CORS
 from models import db, TimeRecord, Employee, Department
 from routes.time_records import time_records_bp
 from routes.employees import employees_bp
 from routes.reports import reports_bp
+from replica import REPLICA_BIND_KEY, init_replica_routing, replica_read
+from report_jobs import init_report_jobs
+from idempotency import init_idempotency
+from profiling import init_profiling
+from analytics import init_analytics
+from sharding import init_sharding, shard_binds
+from routes.profiles import profiles_bp
 
-app = Flask(__name__, static_folder='frontend/dist')
-app.config['SQLALCHEMY_DATABASE_URI'] = os.environ.get('DATABASE_URL', 'sqlite:///time_tracking.db')
-app.config['SQLALCHEMY_TRACK_MODIFICATIONS'] = False
-app.config['SECRET_KEY'] = os.environ.get('SECRET_KEY', 'dev_key')
-
-# Инициализация расширений
-CORS(app)
-db.init_app(app)
-
-# Регистрация маршрутов
-app.register_blueprint(time_records_bp, url_prefix='/api/time-records')
-app.register_blueprint(employees_bp, url_prefix='/api/employees')
-app.register_blueprint(reports_bp, url_prefix='/api/reports')
+def create_app(config=None):
+    """
+    Фабрика приложения. config - словарь с переопределениями конфигурации,
+    применяется поверх значений из переменных окружения.
+    """
+    app = Flask(__name__, static_folder='frontend/dist')
+    app.config['SQLALCHEMY_DATABASE_URI'] = os.environ.get('DATABASE_URL', 'sqlite:///time_tracking.db')
+    app.config['SQLALCHEMY_TRACK_MODIFICATIONS'] = False
+    app.config['SECRET_KEY'] = os.environ.get('SECRET_KEY', 'dev_key')
+    
+    # Реплика для читающих запросов (отчеты, списки); без нее все идет на основную базу
+    binds = {}
+    if os.environ.get('DATABASE_REPLICA_URL'):
+        binds[REPLICA_BIND_KEY] = os.environ['DATABASE_REPLICA_URL']
+    app.config['REPLICA_MAX_LAG_SECONDS'] = int(os.environ.get('REPLICA_MAX_LAG_SECONDS', 5))
+    
+    # Шарды записей рабочего времени по отделам (по умолчанию все в основной базе)
+    shard_urls = [url.strip() for url in os.environ.get('TIME_RECORD_SHARD_URLS', '').split(',') if url.strip()]
+    binds.update(shard_binds(shard_urls))
+    app.config['TIME_RECORD_SHARDS'] = list(shard_binds(shard_urls))
+    app.config['SHARD_DEPARTMENT_MAP'] = json.loads(os.environ.get('SHARD_DEPARTMENT_MAP', '{}'))
+    if binds:
+        app.config['SQLALCHEMY_BINDS'] = binds
+    
+    # Хранилище ответов для Idempotency-Key: 'memory' или 'sqlite' (для нескольких воркеров)
+    app.config['IDEMPOTENCY_BACKEND'] = os.environ.get('IDEMPOTENCY_BACKEND', 'memory')
+    
+    # Профилирование запросов по токену или по выборке (по умолчанию выключено)
+    app.config['PROFILING_ENABLED'] = os.environ.get('PROFILING_ENABLED', '').lower() == 'true'
+    app.config['PROFILING_SECRET'] = os.environ.get('PROFILING_SECRET')
+    app.config['PROFILING_SAMPLE_RATE'] = float(os.environ.get('PROFILING_SAMPLE_RATE', 0))
+    
+    # Допуск опоздания в минутах для отчета о пропусках и опозданиях
+    app.config['ATTENDANCE_GRACE_MINUTES'] = int(os.environ.get('ATTENDANCE_GRACE_MINUTES', 0))
+    
+    # Колоночное хранилище в памяти для отчетов /api/reports/analytics/*
+    app.config['ANALYTICS_ENABLED'] = os.environ.get('ANALYTICS_ENABLED', '').lower() == 'true'
+    
+    if config:
+        app.config.update(config)
+    
+    # Инициализация расширений
+    CORS(app)
+    db.init_app(app)
+    if REPLICA_BIND_KEY in app.config.get('SQLALCHEMY_BINDS', {}):
+        init_replica_routing(app)
+    init_report_jobs(app)
+    init_idempotency(app)
+    init_sharding(app)
+    
+    # Регистрация маршрутов
+    app.register_blueprint(time_records_bp, url_prefix='/api/time-records')
+    app.register_blueprint(employees_bp, url_prefix='/api/employees')
+    app.register_blueprint(reports_bp, url_prefix='/api/reports')
+    if init_profiling(app):
+        app.register_blueprint(profiles_bp, url_prefix='/api/admin/profiles')
+    register_routes(app)
+    init_analytics(app)
+    
+    return app
 
-# Добавляем маршрут для получения отделов
-@app.route('/api/departments', methods=['GET'])
-def get_departments():
-    try:
-        departments = Department.query.all()
-        print(f"Returning {len(departments)} departments")
-        # Добавим вывод списка отделов для отладки
-        for dept in departments:
-            print(f"Department ID: {dept.id}, Name: {dept.name}")
+def register_routes(app):
+    """Маршруты приложения вне блюпринтов: отделы, статус и раздача фронтенда"""
+    # Маршрут для получения отделов
+    @app.route('/api/departments', methods=['GET'])
+    @replica_read
+    def get_departments():
+        try:
+            departments = Department.query.all()
+            print(f"Returning {len(departments)} departments")
+            # Добавим вывод списка отделов для отладки
+            for dept in departments:
+                print(f"Department ID: {dept.id}, Name: {dept.name}")
             
-        response_data = {
-            'items': [dept.to_dict() for dept in departments],
-            'total': len(departments)
-        }
-        print(f"Full response data: {response_data}")
-        return jsonify(response_data)
-    except Exception as e:
-        print(f"Error getting departments: {str(e)}")
-        return jsonify({'error': str(e)}), 500
+            response_data = {
+                'items': [dept.to_dict() for dept in departments],
+                'total': len(departments)
+            }
+            print(f"Full response data: {response_data}")
+            return jsonify(response_data)
+        except Exception as e:
+            print(f"Error getting departments: {str(e)}")
+            return jsonify({'error': str(e)}), 500
 
-@app.route('/')
-def index():
-    try:
-        return app.send_static_file('index.html')
-    except Exception as e:
-        print(f"Ошибка при отправке index.html: {str(e)}")
-        # Запасной вариант - попробовать использовать файл из src
+    @app.route('/')
+    def index():
         try:
-            return send_from_directory('frontend/src', 'index.html')
-        except Exception as e2:
-            print(f"Ошибка при отправке из src: {str(e2)}")
-            return jsonify({"error": "Frontend not built"}), 500
+            return app.send_static_file('index.html')
+        except Exception as e:
+            print(f"Ошибка при отправке index.html: {str(e)}")
+            # Запасной вариант - попробовать использовать файл из src
+            try:
+                return send_from_directory('frontend/src', 'index.html')
+            except Exception as e2:
+                print(f"Ошибка при отправке из src: {str(e2)}")
+                return jsonify({"error": "Frontend not built"}), 500
 
-@app.errorhandler(404)
-def not_found(e):
-    try:
-        return app.send_static_file('index.html')
-    except Exception as ex:
-        print(f"Ошибка 404 при отправке index.html: {str(ex)}")
+    @app.errorhandler(404)
+    def not_found(e):
         try:
-            return send_from_directory('frontend/src', 'index.html')
-        except Exception as e2:
-            print(f"Ошибка 404 при отправке из src: {str(e2)}")
-            return jsonify({"error": "Page not found", "message": str(e)}), 404
+            return app.send_static_file('index.html')
+        except Exception as ex:
+            print(f"Ошибка 404 при отправке index.html: {str(ex)}")
+            try:
+                return send_from_directory('frontend/src', 'index.html')
+            except Exception as e2:
+                print(f"Ошибка 404 при отправке из src: {str(e2)}")
+                return jsonify({"error": "Page not found", "message": str(e)}), 404
 
-@app.route('/api/status')
-def status():
-    return jsonify({"status": "ok"})
+    @app.route('/api/status')
+    def status():
+        return jsonify({"status": "ok"})
 
-# Добавляем маршрут для всех файлов в дистрибутиве
-@app.route('/<path:path>')
-def serve_static(path):
-    try:
-        return app.send_static_file(path)
-    except Exception as e:
-        print(f"Ошибка при отправке статического файла {path}: {str(e)}")
-        return app.send_static_file('index.html')
+    # Добавляем маршрут для всех файлов в дистрибутиве
+    @app.route('/<path:path>')
+    def serve_static(path):
+        try:
+            return app.send_static_file(path)
+        except Exception as e:
+            print(f"Ошибка при отправке статического файла {path}: {str(e)}")
+            return app.send_static_file('index.html')
 
 if __name__ == '__main__':
+    # Сервер разработки. Для продакшена используйте gunicorn (gunicorn.conf.py)
+    app = create_app()
+    
     # Печатаем информацию о путях для отладки
     print(f"Текущая директория: {os.getcwd()}")
     print(f"Статические файлы: {app.static_folder}")
@@ -87,4 +148,4 @@ if __name__ == '__main__':
     
     with app.app_context():
         db.create_all()
-    app.run(debug=True) 
\ No newline at end of file
+    app.run(debug=True)
\ No newline at end of file
@@ -0,0 +1,246 @@
+"""
+Отчет о пропусках и опозданиях по производственному календарю.
+
+Ожидаемые выходы - это все активные сотрудники на все рабочие дни календаря
+work_calendar за период (строка отдела на дату заменяет общую строку), начиная
+с дня приема на работу (Employee.hired_at, если не задан - дата создания
+сотрудника created_at).
+Один запрос левым соединением с time_records по окну дня находит дни без
+единого прихода (анти-соединение) и дни, когда первый приход позже начала
+рабочего дня. Опоздания в пределах допуска (grace_minutes) отбрасываются
+при выдаче строк.
+
+Заполнение календаря:
+
+    python attendance.py calendar --start 2024-01-01 --end 2024-12-31 \\
+        --holidays 2024-01-01,2024-01-02,2024-03-08
+    python attendance.py calendar --start 2024-01-01 --end 2024-12-31 \\
+        --department-id 3 --start-time 08:00 --workdays 0,1,2,3,4,5
+
+Отчет в CSV на стандартный вывод:
+
+    python attendance.py report --start 2024-01-01 --end 2024-01-31 --grace-minutes 5
+"""
+import argparse
+import csv
+import io
+import sys
+from datetime import date, datetime, time, timedelta
+
+from sqlalchemy import and_, exists, func, or_, select
+
+from models import db, Department, Employee, TimeRecord, WorkCalendarDay
+from sharding import shard_department_filter, sharding_enabled, sync_reference_tables
+
+DEFAULT_START_TIME = time(9, 0)
+DEFAULT_WORKDAYS = (0, 1, 2, 3, 4)  # понедельник - пятница
+
+STATUS_ABSENT = 'absent'
+STATUS_LATE = 'late'
+
+CSV_HEADER = [
+    'Дата', 'ID сотрудника', 'Сотрудник', 'Отдел', 'Статус',
+    'Начало дня', 'Первый приход', 'Опоздание, мин'
+]
+CSV_STATUS = {STATUS_ABSENT: 'Отсутствие', STATUS_LATE: 'Опоздание'}
+
+STREAM_BATCH_SIZE = 1000
+
+def build_calendar(start, end, holidays=(), department_id=None,
+                   start_time=DEFAULT_START_TIME, workdays=DEFAULT_WORKDAYS):
+    """Строки календаря на период: рабочие дни по графику, праздники - выходные"""
+    rows = []
+    day = start
+    while day <= end:
+        is_workday = day.weekday() in workdays and day not in holidays
+        day_start = datetime.combine(day, time.min)
+        rows.append({
+            'date': day,
+            'department_id': department_id,
+            'is_workday': is_workday,
+            'starts_at': datetime.combine(day, start_time) if is_workday else None,
+            'day_start': day_start,
+            'day_end': day_start + timedelta(days=1),
+            'description': 'Праздник' if day in holidays else None,
+        })
+        day += timedelta(days=1)
+    return rows
+
+def save_calendar(rows, start, end, department_id=None):
+    """Заменяет строки календаря (общего или отдела) за период"""
+    table = WorkCalendarDay.__table__
+    department_filter = table.c.department_id.is_(None) if department_id is None \
+        else table.c.department_id == department_id
+    db.session.execute(table.delete().where(department_filter, table.c.date.between(start, end)))
+    if rows:
+        db.session.execute(table.insert(), rows)
+    db.session.commit()
+
+def gaps_statement(start_date, end_date, department_id=None, shard_only=False):
+    """
+    Пропуски и опоздания одним запросом: сотрудники x рабочие дни календаря,
+    левое соединение с записями по окну дня и отбор дней без прихода
+    или с первым приходом позже начала дня. shard_only - только сотрудники,
+    записи которых хранятся на шарде текущего запроса.
+    """
+    employees = Employee.__table__
+    departments = Department.__table__
+    records = TimeRecord.__table__
+    calendar = WorkCalendarDay.__table__
+    department_day = calendar.alias('department_day')
+
+    # Общая строка календаря действует, если у отдела нет своей строки на эту дату
+    has_department_day = exists().where(
+        department_day.c.department_id == employees.c.department_id,
+        department_day.c.date == calendar.c.date
+    )
+    first_check_in = func.min(records.c.check_in)
+
+    # Дни до приема сотрудника на работу не считаются. Без даты приема берется дата
+    # создания сотрудника: created_at хранится в UTC, поэтому день приема в этом
+    # случае определяется с точностью до часового пояса
+    hired_on = func.coalesce(employees.c.hired_at, func.date(employees.c.created_at))
+    statement = select(
+        calendar.c.date,
+        employees.c.id.label('employee_id'),
+        employees.c.first_name,
+        employees.c.last_name,
+        departments.c.name.label('department_name'),
+        calendar.c.starts_at,
+        first_check_in.label('first_check_in')
+    ).select_from(
+        employees.join(calendar, and_(
+            calendar.c.date.between(start_date, end_date),
+            calendar.c.date >= hired_on,
+            or_(
+                calendar.c.department_id == employees.c.department_id,
+                and_(calendar.c.department_id.is_(None), ~has_department_day)
+            )
+        )).outerjoin(
+            departments, employees.c.department_id == departments.c.id
+        ).outerjoin(records, and_(
+            records.c.employee_id == employees.c.id,
+            records.c.check_in >= calendar.c.day_start,
+            records.c.check_in < calendar.c.day_end
+        ))
+    ).where(
+        employees.c.is_active == True,
+        calendar.c.is_workday == True
+    )
+
+    if department_id:
+        statement = statement.where(employees.c.department_id == department_id)
+    if shard_only:
+        statement = statement.where(shard_department_filter(employees.c.department_id))
+
+    return statement.group_by(
+        calendar.c.date,
+        employees.c.id,
+        employees.c.first_name,
+        employees.c.last_name,
+        departments.c.name,
+        calendar.c.starts_at
+    ).having(or_(
+        first_check_in.is_(None),
+        first_check_in > calendar.c.starts_at
+    )).order_by(calendar.c.date, employees.c.id)
+
+def gap_rows(result, grace_minutes=0):
+    """Строки отчета из результата запроса; опоздания в пределах допуска пропускаются"""
+    for row in result:
+        if row.first_check_in is None:
+            status = STATUS_ABSENT
+            late_minutes = None
+        else:
+            late_minutes = (row.first_check_in - row.starts_at).total_seconds() / 60
+            if late_minutes <= grace_minutes:
+                continue
+            status = STATUS_LATE
+        yield {
+            'date': row.date.isoformat(),
+            'employee_id': row.employee_id,
+            'employee_name': f"{row.first_name} {row.last_name}",
+            'department_name': row.department_name,
+            'status': status,
+            'starts_at': row.starts_at.isoformat() if row.starts_at else None,
+            'first_check_in': row.first_check_in.isoformat() if row.first_check_in else None,
+            'late_minutes': round(late_minutes) if late_minutes is not None else None,
+        }
+
+def find_gaps(start_date, end_date, department_id=None, grace_minutes=0, shard_only=False):
+    """Выполняет запрос отчета потоково (пачками STREAM_BATCH_SIZE)"""
+    result = db.session.execute(
+        gaps_statement(start_date, end_date, department_id, shard_only),
+        execution_options={'yield_per': STREAM_BATCH_SIZE}
+    )
+    return gap_rows(result, grace_minutes)
+
+def csv_lines(gaps):
+    """Строки CSV по одной, начиная с заголовка"""
+    buffer = io.StringIO()
+    writer = csv.writer(buffer)
+    writer.writerow(CSV_HEADER)
+    yield buffer.getvalue()
+    for gap in gaps:
+        buffer.seek(0)
+        buffer.truncate()
+        writer.writerow([
+            gap['date'],
+            gap['employee_id'],
+            gap['employee_name'],
+            gap['department_name'] or 'Не указан',
+            CSV_STATUS[gap['status']],
+            gap['starts_at'] or '',
+            gap['first_check_in'] or '',
+            gap['late_minutes'] if gap['late_minutes'] is not None else '',
+        ])
+        yield buffer.getvalue()
+
+def main(argv=None):
+    from app import create_app
+
+    parser = argparse.ArgumentParser(description='Производственный календарь и отчет о пропусках')
+    subparsers = parser.add_subparsers(dest='command', required=True)
+
+    calendar_parser = subparsers.add_parser('calendar', help='Заполнить календарь за период')
+    calendar_parser.add_argument('--start', type=date.fromisoformat, required=True)
+    calendar_parser.add_argument('--end', type=date.fromisoformat, required=True)
+    calendar_parser.add_argument('--holidays', default='',
+                                 help='Праздничные дни через запятую (YYYY-MM-DD)')
+    calendar_parser.add_argument('--department-id', type=int, default=None,
+                                 help='График отдела (по умолчанию общий календарь)')
+    calendar_parser.add_argument('--start-time', type=time.fromisoformat, default=DEFAULT_START_TIME)
+    calendar_parser.add_argument('--workdays', default=','.join(map(str, DEFAULT_WORKDAYS)),
+                                 help='Рабочие дни недели через запятую, 0 - понедельник')
+
+    report_parser = subparsers.add_parser('report', help='Отчет о пропусках и опозданиях в CSV')
+    report_parser.add_argument('--start', type=date.fromisoformat, required=True)
+    report_parser.add_argument('--end', type=date.fromisoformat, required=True)
+    report_parser.add_argument('--department-id', type=int, default=None)
+    report_parser.add_argument('--grace-minutes', type=int, default=0)
+
+    args = parser.parse_args(argv)
+
+    app = create_app()
+    with app.app_context():
+        if args.command == 'calendar':
+            holidays = {date.fromisoformat(value) for value in args.holidays.split(',') if value.strip()}
+            workdays = tuple(int(value) for value in args.workdays.split(',') if value.strip())
+            rows = build_calendar(args.start, args.end, holidays, args.department_id,
+                                  args.start_time, workdays)
+            save_calendar(rows, args.start, args.end, args.department_id)
+            if sharding_enabled():
+                sync_reference_tables()
+            print(f"Календарь сохранен: {len(rows)} дней, рабочих {sum(row['is_workday'] for row in rows)}",
+                  file=sys.stderr)
+        else:
+            if sharding_enabled():
+                print("При шардировании используйте GET /api/reports/attendance", file=sys.stderr)
+                return 1
+            gaps = find_gaps(args.start, args.end, args.department_id, args.grace_minutes)
+            for line in csv_lines(gaps):
+                sys.stdout.write(line)
+    return 0
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -1,10 +1,11 @@
-from app import app
+from app import create_app
 from models import db, Department
 
 def fix_duplicate_departments():
     """
     Удаляет дублирующиеся отделы из базы данных, оставляя только уникальные.
     """
+    app = create_app()
     with app.app_context():
         # Получаем все отделы
         all_departments = Department.query.all()
@@ -0,0 +1,78 @@
+"""
+Продакшен-запуск приложения через gunicorn:
+
+    gunicorn --preload -w 4 'app:create_app()'
+
+Gunicorn читает этот файл из текущего каталога. С preload_app приложение
+создается один раз в мастер-процессе, воркеры получают его через fork (код и
+модули разделяются copy-on-write). Каждый воркер открывает собственные
+соединения с БД и прогревает пул и маппинги до приема запросов, затем выводит
+время запуска и объем занятой памяти. Если воркер не смог прогреться (например,
+база недоступна), gunicorn останавливается с ошибкой загрузки воркера.
+Упавшие воркеры gunicorn перезапускает сам.
+"""
+import os
+import sys
+import time
+
+from sqlalchemy import text
+
+# Время запуска мастера, включая импорт приложения (конфиг загружается первым)
+STARTED_AT = time.perf_counter()
+
+try:
+    import resource
+except ImportError:
+    resource = None
+
+bind = f"{os.environ.get('HOST', '0.0.0.0')}:{os.environ.get('PORT', 8000)}"
+workers = int(os.environ.get('WEB_WORKERS', os.cpu_count() or 2))
+# Потоки в воркере: отчеты и фоновые задачи не блокируют остальные запросы
+worker_class = 'gthread'
+threads = int(os.environ.get('WEB_THREADS', 4))
+preload_app = True
+# Сколько соединений с БД открыть в каждом воркере до приема запросов
+warm_connections = int(os.environ.get('WARM_CONNECTIONS', 2))
+
+def memory_usage_kb():
+    """Пиковый объем резидентной памяти процесса в КБ (None, если недоступно)"""
+    if resource is None:
+        return None
+    usage = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    # В macOS значение в байтах, в Linux - в килобайтах
+    return usage // 1024 if sys.platform == 'darwin' else usage
+
+def warm_up(app, connections):
+    """Прогрев пулов соединений и маппингов до приема запросов"""
+    from models import db, Department, Employee, TimeRecord
+
+    with app.app_context():
+        for engine in db.engines.values():
+            # Соединения, унаследованные от мастера, нельзя использовать после fork
+            engine.dispose(close=False)
+            opened = [engine.connect() for _ in range(connections)]
+            for connection in opened:
+                connection.execute(text('SELECT 1'))
+            for connection in opened:
+                connection.close()
+        # Первые запросы настраивают маппинги и заполняют кэш скомпилированных запросов
+        Department.query.first()
+        Employee.query.first()
+        TimeRecord.query.first()
+        db.session.remove()
+
+def when_ready(server):
+    """Мастер создал приложение и слушающий сокет"""
+    memory = memory_usage_kb()
+    server.log.info(f"Приложение создано за {time.perf_counter() - STARTED_AT:.2f} с, "
+                    f"память мастера {memory if memory is not None else '?'} КБ, воркеров: {server.num_workers}")
+
+def pre_fork(server, worker):
+    worker.forked_at = time.perf_counter()
+
+def post_fork(server, worker):
+    """Прогрев воркера; исключение здесь - ошибка загрузки воркера"""
+    warm_up(server.app.wsgi(), warm_connections)
+    memory = memory_usage_kb()
+    server.log.info(f"[worker {worker.pid}] готов через {time.perf_counter() - worker.forked_at:.2f} с, "
+                    f"память {memory if memory is not None else '?'} КБ")
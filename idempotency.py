@@ -0,0 +1,246 @@
+"""
+Поддержка заголовка Idempotency-Key для пишущих эндпоинтов.
+
+Киоски повторяют POST при обрыве связи. Если запрос пришел с заголовком
+Idempotency-Key, первый ответ (кроме ошибок сервера) сохраняется, а повторы
+с тем же ключом получают сохраненный ответ без обращения к базе данных.
+Повтор с тем же ключом, но другим телом запроса отклоняется (422), а пока
+первый запрос еще выполняется - возвращается 409.
+
+Хранилище ограничено по размеру (IDEMPOTENCY_MAX_ENTRIES) и времени жизни
+записей (IDEMPOTENCY_TTL_SECONDS). По умолчанию оно в памяти процесса; для
+нескольких воркеров (gunicorn) используйте IDEMPOTENCY_BACKEND = 'sqlite'.
+"""
+import hashlib
+import json
+import os
+import sqlite3
+import time
+from collections import OrderedDict
+from functools import wraps
+from threading import Lock
+
+from flask import current_app, jsonify, request
+
+IDEMPOTENCY_HEADER = 'Idempotency-Key'
+REPLAYED_HEADER = 'Idempotent-Replayed'
+MAX_KEY_LENGTH = 255
+
+class MemoryIdempotencyStore:
+    """Хранилище ответов в памяти процесса с вытеснением по TTL и размеру"""
+
+    def __init__(self, ttl, max_entries, pending_timeout):
+        self.ttl = ttl
+        self.max_entries = max_entries
+        self.pending_timeout = pending_timeout
+        self.entries = OrderedDict()
+        self.lock = Lock()
+
+    def _evict(self, now):
+        # Записи добавляются по порядку, а TTL у всех одинаковый,
+        # поэтому истекшие записи всегда в начале
+        while self.entries:
+            entry = next(iter(self.entries.values()))
+            if now - entry['created_at'] < self.ttl and len(self.entries) <= self.max_entries:
+                break
+            self.entries.popitem(last=False)
+
+    def reserve(self, key, fingerprint):
+        """
+        Резервирует ключ за текущим запросом. Возвращает None, если ключ
+        зарезервирован, иначе существующую запись.
+        """
+        now = time.time()
+        with self.lock:
+            self._evict(now)
+            entry = self.entries.get(key)
+            if entry is not None:
+                stale = entry['status'] is None and now - entry['created_at'] > self.pending_timeout
+                if not stale:
+                    return dict(entry)
+                del self.entries[key]
+            self.entries[key] = {
+                'fingerprint': fingerprint,
+                'status': None,
+                'body': None,
+                'content_type': None,
+                'created_at': now,
+            }
+            self._evict(now)
+        return None
+
+    def save(self, key, status, body, content_type):
+        with self.lock:
+            entry = self.entries.get(key)
+            if entry is not None:
+                entry.update(status=status, body=body, content_type=content_type)
+
+    def release(self, key):
+        with self.lock:
+            self.entries.pop(key, None)
+
+class SqliteIdempotencyStore:
+    """Хранилище ответов в файле SQLite, общее для нескольких процессов"""
+
+    def __init__(self, path, ttl, max_entries, pending_timeout):
+        self.path = path
+        self.ttl = ttl
+        self.max_entries = max_entries
+        self.pending_timeout = pending_timeout
+        os.makedirs(os.path.dirname(os.path.abspath(path)), exist_ok=True)
+        connection = self._connect()
+        try:
+            connection.execute('PRAGMA journal_mode=WAL')
+            connection.execute(
+                'CREATE TABLE IF NOT EXISTS idempotency_keys ('
+                ' key TEXT PRIMARY KEY,'
+                ' fingerprint TEXT NOT NULL,'
+                ' status INTEGER,'
+                ' body BLOB,'
+                ' content_type TEXT,'
+                ' created_at REAL NOT NULL)'
+            )
+            connection.execute(
+                'CREATE INDEX IF NOT EXISTS ix_idempotency_keys_created_at'
+                ' ON idempotency_keys (created_at)'
+            )
+        finally:
+            connection.close()
+
+    def _connect(self):
+        # Отдельное соединение на операцию: потоки и процессы не делят соединения
+        return sqlite3.connect(self.path, timeout=10, isolation_level=None)
+
+    def reserve(self, key, fingerprint):
+        now = time.time()
+        connection = self._connect()
+        try:
+            connection.execute('BEGIN IMMEDIATE')
+            connection.execute(
+                'DELETE FROM idempotency_keys WHERE created_at < ?'
+                ' OR (status IS NULL AND created_at < ?)',
+                (now - self.ttl, now - self.pending_timeout)
+            )
+            row = connection.execute(
+                'SELECT fingerprint, status, body, content_type, created_at'
+                ' FROM idempotency_keys WHERE key = ?',
+                (key,)
+            ).fetchone()
+            if row is not None:
+                connection.execute('COMMIT')
+                return {
+                    'fingerprint': row[0],
+                    'status': row[1],
+                    'body': row[2],
+                    'content_type': row[3],
+                    'created_at': row[4],
+                }
+            connection.execute(
+                'INSERT INTO idempotency_keys (key, fingerprint, created_at) VALUES (?, ?, ?)',
+                (key, fingerprint, now)
+            )
+            # Ограничение размера: удаляем самые старые записи сверх лимита
+            connection.execute(
+                'DELETE FROM idempotency_keys WHERE key IN ('
+                ' SELECT key FROM idempotency_keys ORDER BY created_at DESC LIMIT -1 OFFSET ?)',
+                (self.max_entries,)
+            )
+            connection.execute('COMMIT')
+            return None
+        except Exception:
+            if connection.in_transaction:
+                connection.execute('ROLLBACK')
+            raise
+        finally:
+            connection.close()
+
+    def save(self, key, status, body, content_type):
+        connection = self._connect()
+        try:
+            connection.execute(
+                'UPDATE idempotency_keys SET status = ?, body = ?, content_type = ? WHERE key = ?',
+                (status, body, content_type, key)
+            )
+        finally:
+            connection.close()
+
+    def release(self, key):
+        connection = self._connect()
+        try:
+            connection.execute('DELETE FROM idempotency_keys WHERE key = ?', (key,))
+        finally:
+            connection.close()
+
+def init_idempotency(app):
+    """Создает хранилище ответов согласно конфигурации приложения"""
+    ttl = app.config.get('IDEMPOTENCY_TTL_SECONDS', 24 * 3600)
+    max_entries = app.config.get('IDEMPOTENCY_MAX_ENTRIES', 10000)
+    pending_timeout = app.config.get('IDEMPOTENCY_PENDING_TIMEOUT', 60)
+
+    if app.config.get('IDEMPOTENCY_BACKEND', 'memory') == 'sqlite':
+        path = app.config.get(
+            'IDEMPOTENCY_SQLITE_PATH', os.path.join(app.instance_path, 'idempotency.db')
+        )
+        store = SqliteIdempotencyStore(path, ttl, max_entries, pending_timeout)
+    else:
+        store = MemoryIdempotencyStore(ttl, max_entries, pending_timeout)
+
+    app.extensions['idempotency'] = store
+    return store
+
+def request_fingerprint():
+    """
+    Отпечаток тела запроса. JSON приводится к каноническому виду, чтобы повтор
+    с другим порядком ключей или пробелами не считался другим запросом;
+    остальные тела сравниваются побайтно.
+    """
+    data = request.get_json(silent=True)
+    if data is not None:
+        body = json.dumps(data, sort_keys=True, separators=(',', ':')).encode('utf-8')
+    else:
+        body = request.get_data()
+    return hashlib.sha256(body).hexdigest()
+
+def idempotent(view):
+    """
+    Декоратор пишущего эндпоинта: повтор запроса с тем же Idempotency-Key
+    возвращает сохраненный ответ, не выполняя обработчик.
+    """
+    @wraps(view)
+    def wrapper(*args, **kwargs):
+        idempotency_key = request.headers.get(IDEMPOTENCY_HEADER)
+        if not idempotency_key:
+            return view(*args, **kwargs)
+        if len(idempotency_key) > MAX_KEY_LENGTH:
+            return jsonify({'error': f'{IDEMPOTENCY_HEADER} is too long'}), 400
+
+        store = current_app.extensions['idempotency']
+        # Ключ действует только для того же метода и пути
+        key = f"{request.method} {request.path} {idempotency_key}"
+        fingerprint = request_fingerprint()
+
+        entry = store.reserve(key, fingerprint)
+        if entry is not None:
+            if entry['fingerprint'] != fingerprint:
+                return jsonify({'error': f'{IDEMPOTENCY_HEADER} was already used with a different request'}), 422
+            if entry['status'] is None:
+                return jsonify({'error': 'A request with this idempotency key is still in progress'}), 409
+            response = current_app.response_class(
+                entry['body'], status=entry['status'], content_type=entry['content_type']
+            )
+            response.headers[REPLAYED_HEADER] = 'true'
+            return response
+
+        try:
+            response = current_app.make_response(view(*args, **kwargs))
+        except Exception:
+            store.release(key)
+            raise
+
+        # Ошибки сервера не сохраняем: повтор должен выполниться заново
+        if response.status_code >= 500:
+            store.release(key)
+        else:
+            store.save(key, response.status_code, response.get_data(), response.content_type)
+        return response
+    return wrapper
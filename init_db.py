@@ -1,11 +1,13 @@
-from app import app, db
-from models import Department, Employee, TimeRecord
+from app import create_app
+from models import db, Department, Employee, TimeRecord
 from datetime import datetime, timedelta
 import random
 from routes.utils import get_moscow_time, utc_to_moscow
+from attendance import build_calendar, save_calendar
 
 def init_db():
     """Инициализация базы данных и заполнение тестовыми данными"""
+    app = create_app()
     with app.app_context():
         # Создаем таблицы
         db.create_all()
@@ -37,7 +39,10 @@ def init_db():
                     position="Директор", department_id=4)
         ]
         
+        # Сотрудники приняты до начала периода записей (отчет о пропусках считает дни с даты приема)
+        hired_at = (get_moscow_time() - timedelta(days=30)).date()
         for emp in employees:
+            emp.hired_at = hired_at
             db.session.add(emp)
         
         db.session.commit()
@@ -81,6 +86,11 @@ def init_db():
         
         db.session.commit()
         
+        # Общий календарь на текущий год: рабочие дни с понедельника по пятницу
+        year_start = moscow_now.date().replace(month=1, day=1)
+        year_end = moscow_now.date().replace(month=12, day=31)
+        save_calendar(build_calendar(year_start, year_end), year_start, year_end)
+        
         print(f"База данных инициализирована. Создано {len(departments)} отделов, {len(employees)} сотрудников и {len(records)} записей.")
     
 if __name__ == "__main__":
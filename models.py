@@ -1,7 +1,19 @@
 from flask_sqlalchemy import SQLAlchemy
 from datetime import datetime
+from replica import RoutingSession
 
-db = SQLAlchemy()
+db = SQLAlchemy(session_options={'class_': RoutingSession})
+
+def _isoformat(value):
+    return value.isoformat() if value else None
+
+def _unique(columns):
+    """Убирает повторяющиеся столбцы, сохраняя порядок"""
+    result = []
+    for column in columns:
+        if not any(column is existing for existing in result):
+            result.append(column)
+    return result
 
 class Department(db.Model):
     __tablename__ = 'departments'
@@ -31,6 +43,8 @@ class Employee(db.Model):
     position = db.Column(db.String(100), nullable=False)
     department_id = db.Column(db.Integer, db.ForeignKey('departments.id'), nullable=True)
     is_active = db.Column(db.Boolean, default=True)
+    # Дата приема на работу; если не задана, ей считается дата создания записи
+    hired_at = db.Column(db.Date, nullable=True)
     created_at = db.Column(db.DateTime, default=datetime.utcnow)
     updated_at = db.Column(db.DateTime, default=datetime.utcnow, onupdate=datetime.utcnow)
     
@@ -47,12 +61,47 @@ class Employee(db.Model):
             'department_id': self.department_id,
             'department_name': self.department.name if self.department else None,
             'is_active': self.is_active,
+            'hired_at': _isoformat(self.hired_at),
             'created_at': self.created_at.isoformat(),
             'updated_at': self.updated_at.isoformat()
         }
+    
+    # Поля to_dict, которые можно запросить выборочно (?fields=)
+    SPARSE_FIELDS = ('id', 'first_name', 'last_name', 'email', 'position', 'department_id',
+                     'department_name', 'is_active', 'hired_at', 'created_at', 'updated_at')
+    
+    @classmethod
+    def sparse_query(cls, fields):
+        """
+        Запрос только столбцов, нужных для полей fields.
+        Отдел присоединяется, только если запрошено его название.
+        """
+        columns = []
+        for field in fields:
+            if field == 'department_name':
+                columns.append(Department.name.label('department_name'))
+            else:
+                columns.append(getattr(cls, field))
+        query = db.session.query(*_unique(columns)).select_from(cls)
+        if 'department_name' in fields:
+            query = query.outerjoin(Department, cls.department_id == Department.id)
+        return query
+    
+    @staticmethod
+    def sparse_dict(row, fields):
+        """Словарь с запрошенными полями в формате to_dict"""
+        item = {}
+        for field in fields:
+            value = getattr(row, field)
+            item[field] = _isoformat(value) if field in ('hired_at', 'created_at', 'updated_at') else value
+        return item
 
 class TimeRecord(db.Model):
     __tablename__ = 'time_records'
+    __table_args__ = (
+        # Выборки записей сотрудника за период (табель, история)
+        db.Index('ix_time_records_employee_check_in', 'employee_id', 'check_in'),
+    )
     
     id = db.Column(db.Integer, primary_key=True)
     employee_id = db.Column(db.Integer, db.ForeignKey('employees.id'), nullable=False)
@@ -85,4 +134,83 @@ class TimeRecord(db.Model):
             'description': self.description,
             'created_at': self.created_at.isoformat(),
             'updated_at': self.updated_at.isoformat()
-        } 
\ No newline at end of file
+        }
+    
+    # Поля to_dict, которые можно запросить выборочно (?fields=)
+    SPARSE_FIELDS = ('id', 'employee_id', 'employee_name', 'check_in', 'check_out',
+                     'duration_hours', 'description', 'created_at', 'updated_at')
+    
+    @classmethod
+    def sparse_query(cls, fields):
+        """
+        Запрос только столбцов, нужных для полей fields.
+        Возвращает (запрос, присоединен ли сотрудник): сотрудник
+        присоединяется, только если запрошено его имя.
+        """
+        columns = []
+        for field in fields:
+            if field == 'employee_name':
+                columns.extend([Employee.first_name, Employee.last_name])
+            elif field == 'duration_hours':
+                columns.extend([cls.check_in, cls.check_out])
+            else:
+                columns.append(getattr(cls, field))
+        query = db.session.query(*_unique(columns)).select_from(cls)
+        joined_employee = 'employee_name' in fields
+        if joined_employee:
+            query = query.join(Employee, cls.employee_id == Employee.id)
+        return query, joined_employee
+    
+    @staticmethod
+    def sparse_dict(row, fields):
+        """Словарь с запрошенными полями в формате to_dict"""
+        item = {}
+        for field in fields:
+            if field == 'employee_name':
+                item[field] = f"{row.first_name} {row.last_name}"
+            elif field == 'duration_hours':
+                seconds = (row.check_out - row.check_in).total_seconds() if row.check_out else 0
+                item[field] = round(seconds / 3600, 2)
+            elif field in ('check_in', 'check_out', 'created_at', 'updated_at'):
+                item[field] = _isoformat(getattr(row, field))
+            else:
+                item[field] = getattr(row, field)
+        return item
+
+class WorkCalendarDay(db.Model):
+    """
+    День производственного календаря. Строки без отдела - общий календарь,
+    строки отдела заменяют общую строку на ту же дату (график отдела).
+    """
+    __tablename__ = 'work_calendar'
+    __table_args__ = (
+        # Строка отдела на дату (замена общего календаря)
+        db.UniqueConstraint('department_id', 'date', name='uq_work_calendar_department_date'),
+        # Одна строка общего календаря на дату: NULL в UniqueConstraint не сравниваются
+        db.Index('uq_work_calendar_common_date', 'date', unique=True,
+                 sqlite_where=db.text('department_id IS NULL'),
+                 postgresql_where=db.text('department_id IS NULL')),
+        db.Index('ix_work_calendar_date', 'date'),
+    )
+    
+    id = db.Column(db.Integer, primary_key=True)
+    date = db.Column(db.Date, nullable=False)
+    department_id = db.Column(db.Integer, db.ForeignKey('departments.id'), nullable=True)
+    is_workday = db.Column(db.Boolean, nullable=False, default=True)
+    starts_at = db.Column(db.DateTime, nullable=True)  # Ожидаемое начало рабочего дня
+    # Окно, в которое приход засчитывается за этот день (для ночных смен можно сдвинуть)
+    day_start = db.Column(db.DateTime, nullable=False)
+    day_end = db.Column(db.DateTime, nullable=False)
+    description = db.Column(db.String(100), nullable=True)
+    
+    def to_dict(self):
+        return {
+            'id': self.id,
+            'date': self.date.isoformat(),
+            'department_id': self.department_id,
+            'is_workday': self.is_workday,
+            'starts_at': _isoformat(self.starts_at),
+            'day_start': self.day_start.isoformat(),
+            'day_end': self.day_end.isoformat(),
+            'description': self.description
+        }
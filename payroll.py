@@ -0,0 +1,322 @@
+"""
+Расчёт сверхурочных и данных для начисления зарплаты по записям TimeRecord.
+
+Записи читаются потоком в порядке (employee_id, check_in) и обрабатываются
+за один проход: для каждого сотрудника считаются обычные и сверхурочные
+часы (по дням и по неделям), ночные часы и нарушения междусменного отдыха.
+Для больших организаций сотрудники делятся на диапазоны ID, которые
+обрабатываются параллельно в пуле процессов.
+
+Запуск из командной строки:
+    python payroll.py --start 2024-01-01 --end 2024-01-31 --workers 4 --output payroll.csv
+"""
+import csv
+import multiprocessing
+import sys
+from concurrent.futures import ProcessPoolExecutor
+from datetime import date, datetime, timedelta
+from itertools import groupby
+
+from sqlalchemy import create_engine, select
+from models import TimeRecord, Employee
+
+# Правила по умолчанию (ТК РФ: 8 часов в день, 40 часов в неделю,
+# ночное время с 22:00 до 06:00, отдых между сменами не менее 11 часов)
+DEFAULT_PAYROLL_RULES = {
+    'daily_regular_hours': 8,
+    'weekly_regular_hours': 40,
+    'night_start_hour': 22,
+    'night_end_hour': 6,
+    'min_rest_hours': 11,
+}
+
+# Размер пачки строк при потоковом чтении из БД
+STREAM_BATCH_SIZE = 5000
+
+def build_rules(overrides=None):
+    """
+    Возвращает набор правил: значения по умолчанию, дополненные переопределениями.
+    Неизвестные ключи и нечисловые значения вызывают ValueError.
+    """
+    rules = dict(DEFAULT_PAYROLL_RULES)
+    for key, value in (overrides or {}).items():
+        if value is None:
+            continue
+        if key not in DEFAULT_PAYROLL_RULES:
+            raise ValueError(f'Unknown payroll rule: {key}')
+        try:
+            rules[key] = float(value)
+        except (TypeError, ValueError):
+            raise ValueError(f'Invalid value for payroll rule {key}: {value}')
+    return rules
+
+def parse_period_end(value):
+    """Конец периода из ISO-строки: дата без времени включает весь этот день"""
+    try:
+        end_day = date.fromisoformat(value)
+    except ValueError:
+        return datetime.fromisoformat(value)
+    return datetime.combine(end_day, datetime.max.time())
+
+def night_seconds(check_in, check_out, rules):
+    """Количество секунд смены, попадающих в ночное время"""
+    night_start = rules['night_start_hour'] * 3600
+    night_end = rules['night_end_hour'] * 3600
+
+    # Считаем в секундах от полуночи дня начала смены
+    midnight = datetime.combine(check_in.date(), datetime.min.time())
+    shift_start = (check_in - midnight).total_seconds()
+    shift_end = (check_out - midnight).total_seconds()
+
+    window_length = night_end - night_start
+    if night_start > night_end:
+        # Ночной интервал переходит через полночь
+        window_length += 86400
+
+    # Начинаем с интервала, открытого накануне: он может захватывать начало смены
+    total = 0.0
+    window_start = night_start - 86400
+    while window_start < shift_end:
+        overlap = min(shift_end, window_start + window_length) - max(shift_start, window_start)
+        if overlap > 0:
+            total += overlap
+        window_start += 86400
+
+    return total
+
+def compute_employee_payroll(employee_id, records, rules):
+    """
+    Расчёт по одному сотруднику за один проход.
+    records - итерируемая последовательность (check_in, check_out),
+    упорядоченная по check_in; открытые записи (check_out = None) пропускаются.
+    """
+    daily_limit = rules['daily_regular_hours'] * 3600
+    weekly_limit = rules['weekly_regular_hours'] * 3600
+    min_rest = rules['min_rest_hours'] * 3600
+
+    totals = {
+        'regular': 0.0,
+        'daily_overtime': 0.0,
+        'weekly_overtime': 0.0,
+        'night': 0.0,
+        'worked': 0.0,
+    }
+    rest_violations = []
+    shift_count = 0
+
+    current_day = None
+    day_seconds = 0.0
+    current_week = None
+    week_regular_seconds = 0.0
+    previous_check_out = None
+
+    def close_day():
+        nonlocal week_regular_seconds
+        overtime = max(0.0, day_seconds - daily_limit)
+        totals['daily_overtime'] += overtime
+        week_regular_seconds += day_seconds - overtime
+
+    def close_week():
+        overtime = max(0.0, week_regular_seconds - weekly_limit)
+        totals['weekly_overtime'] += overtime
+        totals['regular'] += week_regular_seconds - overtime
+
+    for check_in, check_out in records:
+        if check_out is None:
+            continue
+
+        # Смена относится к дню и неделе, в которые она началась
+        day = check_in.date()
+        week = day - timedelta(days=day.weekday())
+
+        if day != current_day:
+            if current_day is not None:
+                close_day()
+            current_day = day
+            day_seconds = 0.0
+
+        if week != current_week:
+            if current_week is not None:
+                close_week()
+            current_week = week
+            week_regular_seconds = 0.0
+
+        seconds = (check_out - check_in).total_seconds()
+        day_seconds += seconds
+        totals['worked'] += seconds
+        totals['night'] += night_seconds(check_in, check_out, rules)
+        shift_count += 1
+
+        if previous_check_out is not None:
+            rest = (check_in - previous_check_out).total_seconds()
+            if rest < min_rest:
+                rest_violations.append({
+                    'previous_check_out': previous_check_out.isoformat(),
+                    'check_in': check_in.isoformat(),
+                    'rest_hours': round(rest / 3600, 2)
+                })
+        if previous_check_out is None or check_out > previous_check_out:
+            previous_check_out = check_out
+
+    if current_day is not None:
+        close_day()
+        close_week()
+
+    return {
+        'employee_id': employee_id,
+        'shift_count': shift_count,
+        'worked_hours': round(totals['worked'] / 3600, 2),
+        'regular_hours': round(totals['regular'] / 3600, 2),
+        'daily_overtime_hours': round(totals['daily_overtime'] / 3600, 2),
+        'weekly_overtime_hours': round(totals['weekly_overtime'] / 3600, 2),
+        'overtime_hours': round((totals['daily_overtime'] + totals['weekly_overtime']) / 3600, 2),
+        'night_hours': round(totals['night'] / 3600, 2),
+        'rest_violation_count': len(rest_violations),
+        'rest_violations': rest_violations,
+    }
+
+def compute_payroll(rows, rules):
+    """
+    Расчёт по потоку строк (employee_id, check_in, check_out),
+    упорядоченному по (employee_id, check_in).
+    """
+    results = []
+    for employee_id, employee_rows in groupby(rows, key=lambda row: row[0]):
+        records = ((row[1], row[2]) for row in employee_rows)
+        results.append(compute_employee_payroll(employee_id, records, rules))
+    return results
+
+def _records_statement(start_date, end_date, department_id=None, id_range=None):
+    """Запрос закрытых записей за период в порядке (employee_id, check_in)"""
+    records = TimeRecord.__table__
+    statement = select(
+        records.c.employee_id,
+        records.c.check_in,
+        records.c.check_out
+    ).where(
+        records.c.check_in >= start_date,
+        records.c.check_in <= end_date,
+        records.c.check_out.isnot(None)
+    )
+
+    if department_id:
+        employees = Employee.__table__
+        statement = statement.join(
+            employees, records.c.employee_id == employees.c.id
+        ).where(employees.c.department_id == department_id)
+
+    if id_range:
+        statement = statement.where(records.c.employee_id.between(*id_range))
+
+    return statement.order_by(records.c.employee_id, records.c.check_in)
+
+def _compute_range(database_uri, start_date, end_date, department_id, id_range, rules):
+    """Задача для процесса пула: своё подключение к БД и расчёт диапазона ID"""
+    engine = create_engine(database_uri)
+    try:
+        with engine.connect() as connection:
+            result = connection.execution_options(yield_per=STREAM_BATCH_SIZE).execute(
+                _records_statement(start_date, end_date, department_id, id_range)
+            )
+            return compute_payroll(result, rules)
+    finally:
+        engine.dispose()
+
+def _split_ranges(employee_ids, parts):
+    """Делит отсортированный список ID на непрерывные диапазоны примерно равного размера"""
+    chunk_size = max(1, -(-len(employee_ids) // parts))
+    return [
+        (employee_ids[i], employee_ids[min(i + chunk_size, len(employee_ids)) - 1])
+        for i in range(0, len(employee_ids), chunk_size)
+    ]
+
+def run_payroll(session, start_date, end_date, department_id=None, rules=None, workers=1):
+    """
+    Расчёт за период для всех сотрудников (или отдела).
+    При workers > 1 сотрудники делятся на диапазоны ID и считаются в пуле процессов,
+    каждый процесс открывает собственное подключение к БД.
+    """
+    rules = rules or build_rules()
+
+    if workers <= 1:
+        result = session.execute(
+            _records_statement(start_date, end_date, department_id),
+            execution_options={'yield_per': STREAM_BATCH_SIZE}
+        )
+        return compute_payroll(result, rules)
+
+    employees = Employee.__table__
+    ids_query = select(employees.c.id).order_by(employees.c.id)
+    if department_id:
+        ids_query = ids_query.where(employees.c.department_id == department_id)
+    employee_ids = session.execute(ids_query).scalars().all()
+    if not employee_ids:
+        return []
+
+    database_uri = session.get_bind().url.render_as_string(hide_password=False)
+    ranges = _split_ranges(employee_ids, workers)
+
+    # spawn: дочерние процессы не наследуют пул соединений родителя
+    context = multiprocessing.get_context('spawn')
+    results = []
+    with ProcessPoolExecutor(max_workers=min(workers, len(ranges)), mp_context=context) as executor:
+        futures = [
+            executor.submit(_compute_range, database_uri, start_date, end_date,
+                            department_id, id_range, rules)
+            for id_range in ranges
+        ]
+        # Диапазоны не пересекаются и идут по возрастанию, порядок сохраняется
+        for future in futures:
+            results.extend(future.result())
+
+    return results
+
+CSV_COLUMNS = [
+    'employee_id', 'shift_count', 'worked_hours', 'regular_hours',
+    'daily_overtime_hours', 'weekly_overtime_hours', 'overtime_hours',
+    'night_hours', 'rest_violation_count'
+]
+
+def main(argv=None):
+    """Запуск расчёта из командной строки с выводом в CSV"""
+    import argparse
+    import time
+
+    parser = argparse.ArgumentParser(description='Расчёт сверхурочных и ночных часов за период')
+    parser.add_argument('--start', required=True, help='Начало периода (ISO, например 2024-01-01)')
+    parser.add_argument('--end', required=True, help='Конец периода (ISO, включительно)')
+    parser.add_argument('--department-id', type=int, default=None)
+    parser.add_argument('--workers', type=int, default=1, help='Количество процессов')
+    parser.add_argument('--output', default=None, help='Файл CSV (по умолчанию stdout)')
+    for key in DEFAULT_PAYROLL_RULES:
+        parser.add_argument('--' + key.replace('_', '-'), dest=key, type=float, default=None)
+    args = parser.parse_args(argv)
+
+    start_date = datetime.fromisoformat(args.start)
+    end_date = parse_period_end(args.end)
+    rules = build_rules({key: getattr(args, key) for key in DEFAULT_PAYROLL_RULES})
+
+    from app import create_app
+    from models import db
+
+    app = create_app()
+    started = time.perf_counter()
+    with app.app_context():
+        results = run_payroll(db.session, start_date, end_date,
+                              department_id=args.department_id, rules=rules, workers=args.workers)
+    elapsed = time.perf_counter() - started
+
+    output = open(args.output, 'w', newline='', encoding='utf-8') if args.output else sys.stdout
+    try:
+        writer = csv.writer(output)
+        writer.writerow(CSV_COLUMNS)
+        for item in results:
+            writer.writerow([item[column] for column in CSV_COLUMNS])
+    finally:
+        if args.output:
+            output.close()
+
+    print(f"Обработано сотрудников: {len(results)} за {elapsed:.2f} с", file=sys.stderr)
+
+if __name__ == '__main__':
+    main()
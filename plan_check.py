@@ -0,0 +1,295 @@
+"""
+Проверка планов выполнения запросов API.
+
+Скрипт заполняет отдельную базу детерминированными тестовыми данными,
+вызывает эндпоинты сотрудников, записей времени и отчетов и перехватывает
+все выполненные SELECT. Для каждого из них снимается план (EXPLAIN QUERY PLAN
+в SQLite, EXPLAIN (FORMAT JSON) в PostgreSQL) и сравнивается с эталоном из
+каталога query_plans/. Проверка завершается с ошибкой, если запрос начал
+полностью сканировать таблицу, которую в эталоне он читал по индексу, или
+если для запроса нет эталона. Запросы в эталоне названы по сценарию и порядковому
+номеру запроса в нем, поэтому правка текста запроса не теряет его эталон.
+
+    python plan_check.py                  # проверка (SQLite во временном файле)
+    python plan_check.py --update         # обновление эталонных планов
+    python plan_check.py --database-url postgresql://localhost/plan_check
+
+Внимание: таблицы в базе из --database-url пересоздаются.
+"""
+import argparse
+import json
+import os
+import random
+import re
+import sys
+import tempfile
+from datetime import datetime, timedelta
+
+from sqlalchemy import event, text
+
+from app import create_app
+from models import db, Department, Employee, TimeRecord
+from attendance import build_calendar, save_calendar
+
+BASELINE_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'query_plans')
+
+SEED_START = datetime(2024, 1, 1)
+SEED_DAYS = 60
+SEED_DEPARTMENTS = 8
+SEED_EMPLOYEES = 200
+
+PERIOD = 'start_date=2024-01-01T00:00:00&end_date=2024-01-31T23:59:59'
+
+# Сценарии: (имя, метод, URL, тело запроса)
+SCENARIOS = [
+    ('employees_list', 'GET', '/api/employees/?page=2&per_page=20', None),
+    ('employees_list_department', 'GET', '/api/employees/?department_id=3&is_active=true', None),
+    ('employees_sparse', 'GET', '/api/employees/?fields=id,last_name,department_name', None),
+    ('employees_search', 'GET', '/api/employees/?search=Name1', None),
+    ('employees_batch', 'GET', '/api/employees/?ids=5,17,42', None),
+    ('employee_detail', 'GET', '/api/employees/17', None),
+    ('employee_time_records', 'GET', '/api/employees/17/time-records?start_date=2024-01-10T00:00:00', None),
+    ('employee_timesheet', 'GET', f'/api/employees/17/timesheet?{PERIOD}', None),
+    ('employees_with_open_records', 'GET', '/api/employees/with-open-records', None),
+    ('time_records_list', 'GET', '/api/time-records/?page=3', None),
+    ('time_records_employee', 'GET', f'/api/time-records/?employee_id=17&{PERIOD}', None),
+    ('time_records_period', 'GET', f'/api/time-records/?{PERIOD}', None),
+    ('time_records_sparse', 'GET', f'/api/time-records/?{PERIOD}&fields=id,check_in,check_out', None),
+    ('time_records_batch', 'POST', '/api/time-records/batch', {'ids': [10, 200, 3000]}),
+    ('time_record_detail', 'GET', '/api/time-records/100', None),
+    ('check_in', 'POST', '/api/time-records/check-in', {'employee_id': 17}),
+    ('check_out', 'POST', '/api/time-records/check-out', {'employee_id': 17}),
+    ('report_summary_employee', 'GET', f'/api/reports/summary?{PERIOD}&group_by=employee', None),
+    ('report_summary_department', 'GET', f'/api/reports/summary?{PERIOD}&group_by=department&department_id=3', None),
+    ('report_summary_date', 'GET', f'/api/reports/summary?{PERIOD}&group_by=date', None),
+    ('report_daily', 'GET', '/api/reports/daily?date=2024-01-15', None),
+    ('report_daily_department', 'GET', '/api/reports/daily?date=2024-01-15&department_id=3', None),
+    ('report_daily_sparse', 'GET', '/api/reports/daily?date=2024-01-15&department_id=3&fields=id,check_in', None),
+    ('report_payroll', 'GET', f'/api/reports/payroll?{PERIOD}', None),
+    ('report_export_summary', 'GET', f'/api/reports/export/csv?{PERIOD}&type=summary', None),
+    ('report_export_detailed', 'GET', f'/api/reports/export/csv?{PERIOD}&type=detailed', None),
+    ('report_attendance', 'GET', '/api/reports/attendance?start_date=2024-01-01&end_date=2024-01-31', None),
+    ('report_attendance_department', 'GET',
+     '/api/reports/attendance?start_date=2024-01-01&end_date=2024-01-31&department_id=3', None),
+]
+
+def seed_database():
+    """Детерминированное заполнение базы тестовыми данными"""
+    rng = random.Random(42)
+    db.drop_all()
+    db.create_all()
+
+    db.session.add_all([Department(name=f'Department {i}') for i in range(1, SEED_DEPARTMENTS + 1)])
+    db.session.commit()
+
+    db.session.add_all([
+        Employee(
+            first_name=f'Name{i}', last_name=f'Surname{i}', email=f'employee{i}@example.com',
+            position='Engineer', department_id=i % SEED_DEPARTMENTS + 1, is_active=i % 10 != 0,
+            # Часть сотрудников принята в середине периода (отчет о пропусках)
+            hired_at=(SEED_START + timedelta(days=14 if i % 25 == 0 else -30)).date()
+        )
+        for i in range(1, SEED_EMPLOYEES + 1)
+    ])
+    db.session.commit()
+
+    records = []
+    for day in range(SEED_DAYS):
+        current = SEED_START + timedelta(days=day)
+        if current.weekday() >= 5:
+            continue
+        for employee_id in range(1, SEED_EMPLOYEES + 1):
+            check_in = current + timedelta(hours=9, minutes=rng.randint(0, 30))
+            check_out = check_in + timedelta(hours=rng.randint(8, 10), minutes=rng.randint(0, 30))
+            records.append({
+                'employee_id': employee_id, 'check_in': check_in,
+                'check_out': check_out, 'description': 'seed'
+            })
+    db.session.execute(TimeRecord.__table__.insert(), records)
+    db.session.commit()
+
+    # Общий календарь и отдельный график одного отдела
+    calendar_end = SEED_START.date() + timedelta(days=SEED_DAYS - 1)
+    save_calendar(build_calendar(SEED_START.date(), calendar_end, {SEED_START.date()}),
+                  SEED_START.date(), calendar_end)
+    save_calendar(build_calendar(SEED_START.date(), calendar_end, department_id=3, workdays=(0, 1, 2, 3)),
+                  SEED_START.date(), calendar_end, department_id=3)
+
+    # Статистика для планировщика (поддерживается и SQLite, и PostgreSQL)
+    db.session.execute(text('ANALYZE'))
+    db.session.commit()
+
+def normalize_sql(statement):
+    return re.sub(r'\s+', ' ', statement).strip()
+
+def _sqlite_plan(connection, statement, parameters):
+    rows = connection.exec_driver_sql(f'EXPLAIN QUERY PLAN {statement}', parameters).fetchall()
+    # Номера индексов и временных деревьев не важны, сравниваем описания шагов
+    return [row[3] for row in rows]
+
+def _postgresql_nodes(node, steps):
+    relation = node.get('Relation Name')
+    index = node.get('Index Name')
+    step = node['Node Type']
+    if index:
+        step += f' using {index}'
+    if relation:
+        step += f' on {relation}'
+    if step.startswith(('Index Scan', 'Index Only Scan')) and 'Index Cond' not in node:
+        # Проход по индексу без условия читает всю таблицу (например, ради ORDER BY)
+        step += ' (full index)'
+    steps.append(step)
+    for child in node.get('Plans', []):
+        _postgresql_nodes(child, steps)
+
+def _postgresql_plan(connection, statement, parameters):
+    row = connection.exec_driver_sql(f'EXPLAIN (FORMAT JSON) {statement}', parameters).fetchone()
+    plan = row[0] if not isinstance(row[0], str) else json.loads(row[0])
+    steps = []
+    _postgresql_nodes(plan[0]['Plan'], steps)
+    return steps
+
+def full_scans(dialect, plan):
+    """
+    Таблицы, которые план читает полностью: в SQLite любой SCAN (в том числе
+    USING INDEX / COVERING INDEX - это проход по всему индексу, в отличие от SEARCH),
+    в PostgreSQL Seq Scan и Index Scan / Index Only Scan без условия по индексу.
+    """
+    tables = set()
+    for step in plan:
+        if dialect == 'sqlite':
+            match = re.match(r'SCAN (?:TABLE )?(\w+)', step)
+            if match and not step.startswith('SCAN CONSTANT ROW'):
+                tables.add(match.group(1))
+        else:
+            match = re.match(r'Seq Scan on (\w+)', step) or \
+                re.match(r'Index (?:Only )?Scan using \w+ on (\w+) \(full index\)', step)
+            if match:
+                tables.add(match.group(1))
+    return sorted(tables)
+
+def capture_plans(app):
+    """Выполняет сценарии и возвращает планы всех перехваченных SELECT"""
+    captured = []
+    capturing = {'enabled': False}
+
+    with app.app_context():
+        seed_database()
+        engine = db.engine
+        dialect = engine.dialect.name
+
+        def before_cursor_execute(conn, cursor, statement, parameters, context, executemany):
+            if capturing['enabled'] and normalize_sql(statement).upper().startswith(('SELECT', 'WITH')):
+                captured.append((statement, parameters))
+
+        event.listen(engine, 'before_cursor_execute', before_cursor_execute)
+
+    client = app.test_client()
+    plans = {}
+    for name, method, url, body in SCENARIOS:
+        captured.clear()
+        capturing['enabled'] = True
+        response = client.open(url, method=method, json=body)
+        # Потоковые ответы выполняют запросы по мере чтения
+        content = response.get_data(as_text=True)
+        capturing['enabled'] = False
+        if response.status_code >= 400:
+            print(f"[{name}] ответ {response.status_code}: {content[:200]}")
+
+        with app.app_context():
+            with db.engine.connect() as connection:
+                explain = _sqlite_plan if dialect == 'sqlite' else _postgresql_plan
+                for number, (statement, parameters) in enumerate(captured, 1):
+                    sql = normalize_sql(statement)
+                    key = f"{name}:{number:02d}"
+                    plan = explain(connection, statement, parameters)
+                    plans[key] = {
+                        'sql': sql,
+                        'plan': plan,
+                        'full_scans': full_scans(dialect, plan),
+                    }
+
+    return dialect, plans
+
+def compare(baseline, current):
+    """Список регрессий (ошибок) и изменений (предупреждений)"""
+    errors = []
+    warnings = []
+    for key, entry in sorted(current.items()):
+        expected = baseline.get(key)
+        if expected is None:
+            errors.append(f"{key}: нет эталонного плана (запустите с --update)\n    {entry['sql']}")
+            continue
+        new_scans = set(entry['full_scans']) - set(expected['full_scans'])
+        if new_scans:
+            errors.append(
+                f"{key}: полное сканирование {', '.join(sorted(new_scans))} вместо индекса\n"
+                f"    {entry['sql']}\n    было: {expected['plan']}\n    стало: {entry['plan']}"
+            )
+        elif entry['plan'] != expected['plan']:
+            warnings.append(f"{key}: план изменился\n    было: {expected['plan']}\n    стало: {entry['plan']}")
+        if entry['sql'] != expected['sql']:
+            warnings.append(f"{key}: текст запроса изменился\n    было: {expected['sql']}\n    стало: {entry['sql']}")
+    for key in sorted(set(baseline) - set(current)):
+        warnings.append(f"{key}: запрос больше не выполняется")
+    return errors, warnings
+
+def baseline_path(dialect):
+    return os.path.join(BASELINE_DIR, f'{dialect}.json')
+
+def load_baseline(dialect):
+    """Эталонные планы для диалекта или None, если их нет"""
+    path = baseline_path(dialect)
+    if not os.path.exists(path):
+        return None
+    with open(path, encoding='utf-8') as f:
+        return json.load(f)
+
+def collect_plans(database_url=None):
+    """Планы запросов сценариев на базе database_url (по умолчанию временный SQLite)"""
+    with tempfile.TemporaryDirectory() as tmp_dir:
+        database_url = database_url or f"sqlite:///{os.path.join(tmp_dir, 'plan_check.db')}"
+        app = create_app({
+            'SQLALCHEMY_DATABASE_URI': database_url,
+            'SQLALCHEMY_BINDS': {},
+            'TIME_RECORD_SHARDS': [],
+            'REPORT_JOBS_DIR': os.path.join(tmp_dir, 'report_jobs'),
+        })
+        dialect, plans = capture_plans(app)
+        with app.app_context():
+            db.engine.dispose()
+    return dialect, plans
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description='Проверка планов выполнения запросов API')
+    parser.add_argument('--database-url', default=None,
+                        help='База для проверки (по умолчанию временный файл SQLite)')
+    parser.add_argument('--update', action='store_true', help='Перезаписать эталонные планы')
+    args = parser.parse_args(argv)
+
+    dialect, plans = collect_plans(args.database_url)
+    path = baseline_path(dialect)
+
+    if args.update:
+        os.makedirs(BASELINE_DIR, exist_ok=True)
+        with open(path, 'w', encoding='utf-8') as f:
+            json.dump(plans, f, ensure_ascii=False, indent=2, sort_keys=True)
+            f.write('\n')
+        print(f"Эталонные планы обновлены: {path} ({len(plans)} запросов)")
+        return 0
+
+    baseline = load_baseline(dialect)
+    if baseline is None:
+        print(f"Нет эталонных планов {path}, запустите с --update")
+        return 1
+
+    errors, warnings = compare(baseline, plans)
+    for warning in warnings:
+        print(f"ПРЕДУПРЕЖДЕНИЕ {warning}")
+    for error in errors:
+        print(f"ОШИБКА {error}")
+    print(f"Проверено запросов: {len(plans)}, регрессий: {len(errors)}, изменений: {len(warnings)}")
+    return 1 if errors else 0
+
+if __name__ == '__main__':
+    sys.exit(main())
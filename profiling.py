@@ -0,0 +1,192 @@
+"""
+Профилирование отдельных запросов по требованию.
+
+Включается конфигурацией PROFILING_ENABLED. Запрос профилируется, если он
+пришел с заголовком X-Profile-Token, совпадающим с PROFILING_SECRET (любой
+эндпоинт), или попал в выборку PROFILING_SAMPLE_RATE (только эндпоинты из
+PROFILING_ENDPOINTS: отчеты и списки). Такой запрос выполняется под cProfile,
+а все SQL-запросы записываются в хронологию (текст, параметры, длительность).
+Результат сохраняется в PROFILING_DIR и доступен через /api/admin/profiles.
+
+В процессе профилируется не больше одного запроса одновременно: cProfile
+нельзя включить дважды (в Python 3.12+ это ValueError), поэтому запрос,
+пришедший во время профилирования другого, выполняется без профиля. Потоковые
+ответы (CSV отчета о пропусках) профилируются только до начала ответа:
+after_request вызывается раньше, чем формируется тело.
+
+Если профилирование выключено, обработчики и слушатели событий вообще не
+регистрируются, поэтому запросы не несут никаких дополнительных затрат.
+"""
+import cProfile
+import hmac
+import io
+import json
+import os
+import pstats
+import random
+import time
+import uuid
+from fnmatch import fnmatch
+from threading import Lock
+
+from flask import current_app, g, has_app_context, request
+from sqlalchemy import event
+from sqlalchemy.engine import Engine
+
+PROFILE_HEADER = 'X-Profile-Token'
+PROFILE_ID_HEADER = 'X-Profile-Id'
+
+# Отчеты и списочные эндпоинты
+DEFAULT_PROFILED_ENDPOINTS = (
+    'reports.*',
+    'employees.get_employees',
+    'employees.get_employees_with_open_records',
+    'time_records.get_time_records',
+    'get_departments',
+)
+
+MAX_PARAMETERS_LENGTH = 500
+TOP_FUNCTIONS = 40
+
+# Профилируемый запрос процесса; занята - следующий запрос идет без профиля
+_profile_lock = Lock()
+
+def token_valid():
+    """Совпадает ли токен из заголовка с секретом профилирования"""
+    secret = current_app.config.get('PROFILING_SECRET')
+    token = request.headers.get(PROFILE_HEADER)
+    if not secret or token is None:
+        return False
+    # Сравнение за постоянное время, чтобы не подбирать секрет по времени ответа
+    return hmac.compare_digest(token.encode('utf-8'), secret.encode('utf-8'))
+
+def profiles_dir(app):
+    return app.config.get('PROFILING_DIR', os.path.join(app.instance_path, 'profiles'))
+
+def _should_profile(app):
+    if token_valid():
+        return True
+    sample_rate = app.config.get('PROFILING_SAMPLE_RATE', 0)
+    if not sample_rate or random.random() >= sample_rate:
+        return False
+    endpoint = request.endpoint or ''
+    patterns = app.config.get('PROFILING_ENDPOINTS', DEFAULT_PROFILED_ENDPOINTS)
+    return any(fnmatch(endpoint, pattern) for pattern in patterns)
+
+def _before_cursor_execute(conn, cursor, statement, parameters, context, executemany):
+    if has_app_context() and g.get('profile') is not None:
+        context._profile_started = time.perf_counter()
+
+def _after_cursor_execute(conn, cursor, statement, parameters, context, executemany):
+    if not has_app_context():
+        return
+    profile = g.get('profile')
+    started = getattr(context, '_profile_started', None)
+    if profile is None or started is None:
+        return
+    finished = time.perf_counter()
+    profile['sql'].append({
+        'statement': statement,
+        'parameters': repr(parameters)[:MAX_PARAMETERS_LENGTH],
+        'start_ms': round((started - profile['started']) * 1000, 3),
+        'duration_ms': round((finished - started) * 1000, 3),
+    })
+
+def _prune(directory, max_artifacts):
+    """Оставляет только последние max_artifacts профилей"""
+    metas = sorted(
+        (name for name in os.listdir(directory) if name.endswith('.json')),
+        key=lambda name: os.path.getmtime(os.path.join(directory, name))
+    )
+    for name in metas[:max(0, len(metas) - max_artifacts)]:
+        profile_id = name[:-len('.json')]
+        for file_name in (name, f'{profile_id}.prof'):
+            try:
+                os.remove(os.path.join(directory, file_name))
+            except OSError:
+                pass
+
+def _save(app, profile, response):
+    profiler = profile['profiler']
+    duration = time.perf_counter() - profile['started']
+    directory = profiles_dir(app)
+    os.makedirs(directory, exist_ok=True)
+
+    profiler.dump_stats(os.path.join(directory, f"{profile['id']}.prof"))
+
+    stats_output = io.StringIO()
+    pstats.Stats(profiler, stream=stats_output).sort_stats('cumulative').print_stats(TOP_FUNCTIONS)
+
+    sql = profile['sql']
+    meta = {
+        'id': profile['id'],
+        'created_at': time.time(),
+        'method': request.method,
+        'path': request.full_path.rstrip('?'),
+        'endpoint': request.endpoint,
+        'status': response.status_code,
+        # Тело потокового ответа формируется после сохранения профиля
+        'streamed': response.is_streamed,
+        'duration_ms': round(duration * 1000, 3),
+        'trigger': profile['trigger'],
+        'sql_count': len(sql),
+        'sql_duration_ms': round(sum(item['duration_ms'] for item in sql), 3),
+        'sql': sql,
+        'top_functions': stats_output.getvalue(),
+    }
+    with open(os.path.join(directory, f"{profile['id']}.json"), 'w', encoding='utf-8') as f:
+        json.dump(meta, f, ensure_ascii=False)
+
+    _prune(directory, app.config.get('PROFILING_MAX_ARTIFACTS', 100))
+
+def init_profiling(app):
+    """Регистрирует обработчики профилирования, если оно включено в конфигурации"""
+    if not app.config.get('PROFILING_ENABLED'):
+        return False
+
+    event.listen(Engine, 'before_cursor_execute', _before_cursor_execute)
+    event.listen(Engine, 'after_cursor_execute', _after_cursor_execute)
+
+    @app.before_request
+    def start_profile():
+        if not _should_profile(app) or not _profile_lock.acquire(blocking=False):
+            return
+        profiler = cProfile.Profile()
+        try:
+            profiler.enable()
+        except ValueError as e:
+            # Профилировщик уже включен в этом процессе кем-то другим
+            _profile_lock.release()
+            print(f"Профилирование запроса пропущено: {str(e)}")
+            return
+        g.profile = {
+            'id': uuid.uuid4().hex,
+            'profiler': profiler,
+            'started': time.perf_counter(),
+            'trigger': 'token' if token_valid() else 'sample',
+            'sql': [],
+        }
+
+    @app.after_request
+    def finish_profile(response):
+        profile = g.pop('profile', None)
+        if profile is None:
+            return response
+        profile['profiler'].disable()
+        _profile_lock.release()
+        try:
+            _save(app, profile, response)
+            response.headers[PROFILE_ID_HEADER] = profile['id']
+        except Exception as e:
+            print(f"Ошибка при сохранении профиля: {str(e)}")
+        return response
+
+    @app.teardown_request
+    def stop_profile(exc):
+        # Если обработчик упал, after_request не вызывается
+        profile = g.pop('profile', None)
+        if profile is not None:
+            profile['profiler'].disable()
+            _profile_lock.release()
+
+    return True
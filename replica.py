@@ -0,0 +1,212 @@
+"""
+Маршрутизация читающих запросов на реплику базы данных.
+
+Реплика подключается через SQLALCHEMY_BINDS под ключом 'replica'
+(переменная окружения DATABASE_REPLICA_URL). Запросы, помеченные как
+читающие (блюпринт отчетов, списки, панель), выполняются на реплике,
+все записи и остальные запросы - на основной базе.
+
+Чтение с основной базы принудительно:
+- заголовок X-Read-Primary: 1 или параметр ?consistency=primary;
+- в течение REPLICA_MAX_LAG_SECONDS после успешной записи от того же клиента
+  (cookie last_write, read-your-writes);
+- если реплика недоступна (проверка не чаще REPLICA_HEALTH_CHECK_INTERVAL секунд).
+
+Запрос, упавший на реплике с OperationalError, повторяется на основной базе.
+Недоступной до следующей проверки реплика помечается, только если ошибка
+означает потерю соединения; ошибка отдельного запроса (таймаут, нет таблицы)
+на остальные запросы не влияет.
+
+Схему и данные основной базы на пустую реплику (например, второй файл SQLite
+для локальной проверки) копирует команда:
+
+    python replica.py prepare
+
+Та же сессия направляет запросы к шардированным таблицам на шард из g.shard
+(см. sharding.py); при g.shard_only на шард идут все запросы.
+"""
+import argparse
+import sys
+import time
+from functools import wraps
+from threading import Lock
+
+from flask import current_app, g, request
+from flask_sqlalchemy.session import Session
+from sqlalchemy import inspect, select, text
+from sqlalchemy.exc import OperationalError
+
+REPLICA_BIND_KEY = 'replica'
+LAST_WRITE_COOKIE = 'last_write'
+WRITE_METHODS = ('POST', 'PUT', 'PATCH', 'DELETE')
+
+# Таблицы, которые хранятся на шардах
+SHARDED_TABLES = ('time_records',)
+
+# Состояние реплики в процессе: engine -> (доступна, время проверки)
+_health = {}
+_health_lock = Lock()
+
+def _replica_available(engine):
+    """Проверяет доступность реплики, кэшируя результат на интервал проверки"""
+    interval = current_app.config.get('REPLICA_HEALTH_CHECK_INTERVAL', 30)
+    now = time.monotonic()
+    available, checked_at = _health.get(engine, (True, None))
+    if checked_at is not None and now - checked_at < interval:
+        return available
+
+    with _health_lock:
+        available, checked_at = _health.get(engine, (True, None))
+        if checked_at is not None and now - checked_at < interval:
+            return available
+        try:
+            with engine.connect() as connection:
+                connection.execute(text('SELECT 1'))
+            available = True
+        except Exception as e:
+            print(f"Реплика недоступна, чтение с основной базы: {str(e)}")
+            available = False
+        _health[engine] = (available, now)
+
+    return available
+
+def _mark_unavailable(engine):
+    """Помечает реплику недоступной до следующей проверки"""
+    with _health_lock:
+        _health[engine] = (False, time.monotonic())
+
+def _sharded(mapper, clause):
+    """Относится ли запрос к шардированной таблице (по маппингу или таблице DML)"""
+    if mapper is not None:
+        return inspect(mapper).local_table.name in SHARDED_TABLES
+    table = getattr(clause, 'table', None)
+    return getattr(table, 'name', None) in SHARDED_TABLES
+
+class RoutingSession(Session):
+    """
+    Сессия, направляющая чтение на реплику, если текущий запрос помечен как читающий.
+    Запись (flush) всегда выполняется на основной базе (time_records - на шарде).
+    """
+
+    def get_bind(self, mapper=None, clause=None, bind=None, **kwargs):
+        if bind is None and g and g.get('shard') is not None:
+            if g.get('shard_only') or _sharded(mapper, clause):
+                return self._db.engines[g.shard]
+        if bind is None and not self._flushing and not self._force_primary and g and g.get('use_replica'):
+            engine = self._db.engines.get(REPLICA_BIND_KEY)
+            if engine is not None and _replica_available(engine):
+                self._replica_used = True
+                return engine
+        return super().get_bind(mapper=mapper, clause=clause, bind=bind, **kwargs)
+
+    _force_primary = False
+
+    def _with_replica_fallback(self, method, *args, **kwargs):
+        """
+        Выполняет запрос; если он ушел на реплику и упал с OperationalError,
+        повторяет его на основной базе. При потере соединения с репликой она
+        помечается недоступной, и на основную базу идут и остальные запросы.
+        """
+        self._replica_used = False
+        try:
+            return method(*args, **kwargs)
+        except OperationalError as e:
+            if not self._replica_used:
+                raise
+            if e.connection_invalidated:
+                print(f"Реплика недоступна, чтение с основной базы: {str(e)}")
+                _mark_unavailable(self._db.engines[REPLICA_BIND_KEY])
+            else:
+                print(f"Ошибка запроса на реплике, повтор на основной базе: {str(e)}")
+        self._force_primary = True
+        try:
+            return method(*args, **kwargs)
+        finally:
+            self._force_primary = False
+
+    def execute(self, *args, **kwargs):
+        return self._with_replica_fallback(super().execute, *args, **kwargs)
+
+    def scalar(self, *args, **kwargs):
+        return self._with_replica_fallback(super().scalar, *args, **kwargs)
+
+    def scalars(self, *args, **kwargs):
+        return self._with_replica_fallback(super().scalars, *args, **kwargs)
+
+def _primary_required():
+    """Нужно ли читать с основной базы (read-your-writes и явный запрос клиента)"""
+    if request.headers.get('X-Read-Primary') == '1':
+        return True
+    if request.args.get('consistency') == 'primary':
+        return True
+    # Cookie живет REPLICA_MAX_LAG_SECONDS, само наличие означает недавнюю запись
+    return LAST_WRITE_COOKIE in request.cookies
+
+def use_replica():
+    """Помечает текущий запрос как читающий с реплики (если это допустимо)"""
+    if request.method == 'GET' and not _primary_required():
+        g.use_replica = True
+
+def replica_read(view):
+    """Декоратор для читающих представлений: выполнение запросов на реплике"""
+    @wraps(view)
+    def wrapper(*args, **kwargs):
+        use_replica()
+        return view(*args, **kwargs)
+    return wrapper
+
+def init_replica_routing(app):
+    """Регистрирует обработчики read-your-writes для приложения"""
+
+    @app.after_request
+    def remember_write(response):
+        if request.method in WRITE_METHODS and response.status_code < 400:
+            max_lag = app.config.get('REPLICA_MAX_LAG_SECONDS', 5)
+            response.set_cookie(LAST_WRITE_COOKIE, str(int(time.time())),
+                                max_age=max_lag, httponly=True, samesite='Lax')
+        return response
+
+def prepare_replica(batch_size=1000):
+    """
+    Создает таблицы основной базы на реплике и копирует в них данные.
+    Для локальной проверки; настоящую реплику наполняет репликация СУБД.
+    """
+    from models import db
+
+    replica = db.engines[REPLICA_BIND_KEY]
+    tables = [table for table in db.metadata.sorted_tables if table.info.get('bind_key') is None]
+    db.metadata.create_all(bind=replica, tables=tables)
+
+    copied = {}
+    with db.engines[None].connect() as source, replica.begin() as target:
+        for table in reversed(tables):
+            target.execute(table.delete())
+        for table in tables:
+            result = source.execute(select(table)).mappings()
+            copied[table.name] = 0
+            while True:
+                rows = [dict(row) for row in result.fetchmany(batch_size)]
+                if not rows:
+                    break
+                target.execute(table.insert(), rows)
+                copied[table.name] += len(rows)
+    return copied
+
+def main(argv=None):
+    from app import create_app
+
+    parser = argparse.ArgumentParser(description='Обслуживание реплики для читающих запросов')
+    parser.add_argument('command', choices=['prepare'])
+    parser.parse_args(argv)
+
+    app = create_app()
+    with app.app_context():
+        if REPLICA_BIND_KEY not in app.config.get('SQLALCHEMY_BINDS', {}):
+            print("Реплика не настроена (DATABASE_REPLICA_URL)")
+            return 1
+        for table, count in prepare_replica().items():
+            print(f"{table}: скопировано строк {count}")
+    return 0
+
+if __name__ == '__main__':
+    sys.exit(main())
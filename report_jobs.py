@@ -0,0 +1,256 @@
+"""
+Фоновое выполнение долгих отчетов.
+
+POST /api/reports/jobs проверяет параметры, ставит отчет в очередь ограниченного
+пула потоков и сразу возвращает ID задачи. Отчет строится теми же функциями,
+что и у синхронного эндпоинта (routes/reports.py регистрирует их через
+register_report_type), но без HTTP-запроса и его обработчиков; чтение - с реплики,
+если она настроена. Результат записывается на диск (REPORT_JOBS_DIR) и
+доступен для скачивания до истечения REPORT_JOB_TTL_SECONDS. Состояние задачи
+хранится рядом с результатом в JSON, поэтому его видит любой процесс,
+работающий с тем же каталогом. Одинаковые запросы, пока задача не завершена,
+присоединяются к уже существующей задаче - и в других процессах: ключ запроса
+закрепляется за задачей файлом <ключ>.key в том же каталоге.
+
+Незавершенная задача считается брошенной (например, процесс, выполнявший ее,
+завершился) через REPORT_JOB_TIMEOUT_SECONDS после создания: она перестает
+отдаваться API, удаляется при очистке, а одинаковый запрос создает новую задачу.
+
+Ход выполнения отражается только статусом задачи (queued, running, done, failed).
+"""
+import hashlib
+import json
+import os
+import time
+import uuid
+from concurrent.futures import ThreadPoolExecutor
+
+from flask import g
+
+# Тип задачи -> (разбор параметров, построение отчета, результат - CSV)
+REPORT_TYPES = {}
+
+STATUS_QUEUED = 'queued'
+STATUS_RUNNING = 'running'
+STATUS_DONE = 'done'
+STATUS_FAILED = 'failed'
+
+def register_report_type(report_type, parse_params, build, csv=False):
+    """
+    Регистрирует отчет для фонового выполнения. parse_params(params) проверяет
+    параметры (ValueError - ошибка для ответа 400), build(разобранные параметры)
+    возвращает данные для JSON или, если csv, пару (имя файла, строки CSV).
+    """
+    REPORT_TYPES[report_type] = (parse_params, build, csv)
+
+class ReportJobManager:
+    """Очередь фоновых отчетов с сохранением результатов на диск"""
+
+    def __init__(self, app):
+        self.app = app
+        self.directory = app.config.get(
+            'REPORT_JOBS_DIR', os.path.join(app.instance_path, 'report_jobs')
+        )
+        self.ttl = app.config.get('REPORT_JOB_TTL_SECONDS', 3600)
+        self.timeout = app.config.get('REPORT_JOB_TIMEOUT_SECONDS', 3600)
+        self.executor = ThreadPoolExecutor(
+            max_workers=app.config.get('REPORT_JOB_WORKERS', 2),
+            thread_name_prefix='report-job'
+        )
+        os.makedirs(self.directory, exist_ok=True)
+
+    def _meta_path(self, job_id):
+        return os.path.join(self.directory, f'{job_id}.json')
+
+    def _key_path(self, key):
+        return os.path.join(self.directory, f'{key}.key')
+
+    def _save(self, job):
+        # Атомарная запись: читатели не увидят частично записанный файл
+        path = self._meta_path(job['id'])
+        tmp_path = f'{path}.tmp'
+        with open(tmp_path, 'w', encoding='utf-8') as f:
+            json.dump(job, f, ensure_ascii=False)
+        os.replace(tmp_path, path)
+
+    def get(self, job_id):
+        """Состояние задачи или None, если задача не найдена или истекла"""
+        if not job_id.isalnum():
+            return None
+        try:
+            with open(self._meta_path(job_id), encoding='utf-8') as f:
+                job = json.load(f)
+        except (OSError, ValueError):
+            return None
+        if job.get('expires_at') and job['expires_at'] < time.time():
+            return None
+        return job
+
+    def _claim(self, key, job_id):
+        """
+        Закрепляет ключ запроса за задачей job_id. Возвращает незавершенную задачу,
+        за которой ключ уже закреплен (в этом или другом процессе), или None.
+        """
+        path = self._key_path(key)
+        tmp_path = f'{path}.{job_id}.tmp'
+        with open(tmp_path, 'w', encoding='utf-8') as f:
+            f.write(job_id)
+        try:
+            for _ in range(3):
+                try:
+                    # link атомарно создает файл ключа уже с содержимым или падает, если он есть
+                    os.link(tmp_path, path)
+                    return None
+                except FileExistsError:
+                    pass
+                try:
+                    with open(path, encoding='utf-8') as f:
+                        owner_id = f.read().strip()
+                except OSError:
+                    continue
+                owner = self.get(owner_id)
+                if owner and owner['status'] in (STATUS_QUEUED, STATUS_RUNNING):
+                    return owner
+                # Задача ключа завершена или брошена - освобождаем ключ
+                self._release(key, owner_id)
+            raise RuntimeError(f'Could not claim report job key {key}')
+        finally:
+            os.remove(tmp_path)
+
+    def _release(self, key, job_id):
+        """Освобождает ключ запроса, если он закреплен за задачей job_id"""
+        path = self._key_path(key)
+        try:
+            with open(path, encoding='utf-8') as f:
+                if f.read().strip() != job_id:
+                    return
+            os.remove(path)
+        except OSError:
+            pass
+
+    def result_path(self, job):
+        return os.path.join(self.directory, job['result_file'])
+
+    def submit(self, report_type, params):
+        """
+        Ставит отчет в очередь. Возвращает (задача, создана ли новая).
+        Выбрасывает ValueError для неизвестного типа отчета.
+        """
+        if report_type not in REPORT_TYPES:
+            raise ValueError(f'Unknown report type: {report_type}')
+        params = {key: str(value) for key, value in (params or {}).items() if value is not None}
+        # Ошибки параметров видны сразу, а не после выполнения задачи
+        parse_params, _, _ = REPORT_TYPES[report_type]
+        parse_params(params)
+
+        key = hashlib.sha1(
+            json.dumps([report_type, params], sort_keys=True).encode('utf-8')
+        ).hexdigest()
+
+        self.cleanup()
+
+        created_at = time.time()
+        job = {
+            'id': uuid.uuid4().hex,
+            'type': report_type,
+            'params': params,
+            'key': key,
+            'status': STATUS_QUEUED,
+            'created_at': created_at,
+            'started_at': None,
+            'finished_at': None,
+            # Срок для незавершенной задачи; после завершения - срок хранения результата
+            'expires_at': created_at + self.timeout,
+            'result_file': None,
+            'error': None,
+        }
+        # Метаданные сохраняются до закрепления ключа: по ключу задачу сразу видят другие процессы
+        self._save(job)
+        existing = self._claim(key, job['id'])
+        if existing:
+            os.remove(self._meta_path(job['id']))
+            return existing, False
+
+        self.executor.submit(self._run, job, key)
+        return job, True
+
+    def _set_status(self, job, status, **fields):
+        job.update(fields)
+        job['status'] = status
+        self._save(job)
+
+    def _run(self, job, key):
+        """Построение отчета функциями синхронного эндпоинта и запись результата"""
+        parse_params, build, is_csv = REPORT_TYPES[job['type']]
+        self._set_status(job, STATUS_RUNNING, started_at=time.time())
+        try:
+            with self.app.app_context():
+                # Отчеты только читают данные, как и синхронные эндпоинты - с реплики
+                g.use_replica = True
+                result = build(parse_params(job['params']))
+                if is_csv:
+                    # Файл CSV с BOM, чтобы его правильно открывал Excel
+                    job['filename'], lines = result
+                    result_file = f"{job['id']}.csv"
+                    with open(os.path.join(self.directory, result_file), 'w',
+                              encoding='utf-8-sig', newline='') as f:
+                        f.writelines(lines)
+                else:
+                    job['filename'] = f"{job['type']}_report.json"
+                    result_file = f"{job['id']}.result.json"
+                    with open(os.path.join(self.directory, result_file), 'w', encoding='utf-8') as f:
+                        f.write(self.app.json.dumps(result))
+
+            finished_at = time.time()
+            self._set_status(job, STATUS_DONE, finished_at=finished_at,
+                             expires_at=finished_at + self.ttl, result_file=result_file)
+        except Exception as e:
+            print(f"Ошибка при выполнении фонового отчета {job['id']}: {str(e)}")
+            finished_at = time.time()
+            self._set_status(job, STATUS_FAILED, finished_at=finished_at,
+                             expires_at=finished_at + self.ttl, error=str(e))
+        finally:
+            self._release(key, job['id'])
+
+    def cleanup(self):
+        """Удаляет истекшие задачи (в том числе брошенные незавершенные) и их результаты"""
+        now = time.time()
+        for name in os.listdir(self.directory):
+            if not name.endswith('.json') or name.endswith('.result.json'):
+                continue
+            path = os.path.join(self.directory, name)
+            try:
+                with open(path, encoding='utf-8') as f:
+                    job = json.load(f)
+            except (OSError, ValueError):
+                continue
+            if job.get('expires_at') and job['expires_at'] >= now:
+                continue
+            if job.get('key'):
+                self._release(job['key'], job['id'])
+            for file_name in (job.get('result_file'), name):
+                if file_name:
+                    try:
+                        os.remove(os.path.join(self.directory, file_name))
+                    except OSError:
+                        pass
+
+def init_report_jobs(app):
+    """Создает менеджер фоновых отчетов для приложения"""
+    app.extensions['report_jobs'] = ReportJobManager(app)
+    return app.extensions['report_jobs']
+
+def serialize_job(job):
+    """Представление задачи для API"""
+    return {
+        'id': job['id'],
+        'type': job['type'],
+        'params': job['params'],
+        'status': job['status'],
+        'created_at': job['created_at'],
+        'started_at': job['started_at'],
+        'finished_at': job['finished_at'],
+        'expires_at': job['expires_at'],
+        'error': job['error'],
+        'download_url': f"/api/reports/jobs/{job['id']}/download" if job['status'] == STATUS_DONE else None,
+    }
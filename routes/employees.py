@@ -1,19 +1,45 @@
 from flask import Blueprint, request, jsonify
 from models import db, Employee, Department, TimeRecord
 from sqlalchemy import desc
+from datetime import date, datetime, timedelta
+from sqlalchemy.orm import joinedload
+from routes.utils import parse_ids, batch_response, parse_fields
+from replica import replica_read
+from idempotency import idempotent
+from sharding import (
+    sharding_enabled, use_employee_shard, on_employee_changed, fan_out,
+    copy_employee_records, discard_copied_records
+)
 
 employees_bp = Blueprint('employees', __name__)
 
+def _parse_hired_at(value):
+    """Дата приема из запроса (YYYY-MM-DD) или None"""
+    return date.fromisoformat(value) if value else None
+
 @employees_bp.route('/', methods=['GET'])
+@replica_read
 def get_employees():
     """Получение списка сотрудников с возможностью фильтрации"""
+    if 'ids' in request.args:
+        return _get_employees_batch(request.args.get('ids'))
+    
     department_id = request.args.get('department_id', type=int)
     is_active = request.args.get('is_active')
     search = request.args.get('search', '')
     page = request.args.get('page', 1, type=int)
     per_page = request.args.get('per_page', 20, type=int)
     
-    query = Employee.query
+    try:
+        fields = parse_fields(request.args.get('fields'), Employee.SPARSE_FIELDS)
+    except ValueError as e:
+        return jsonify({'error': str(e)}), 400
+    
+    if fields:
+        # Только запрошенные столбцы, отдел присоединяется лишь для department_name
+        query = Employee.sparse_query(fields)
+    else:
+        query = Employee.query.options(joinedload(Employee.department))
     
     if department_id:
         query = query.filter(Employee.department_id == department_id)
@@ -35,13 +61,38 @@ def get_employees():
     
     employees = query.paginate(page=page, per_page=per_page)
     
+    if fields:
+        items = [Employee.sparse_dict(row, fields) for row in employees.items]
+    else:
+        items = [employee.to_dict() for employee in employees.items]
+    
     return jsonify({
-        'items': [employee.to_dict() for employee in employees.items],
+        'items': items,
         'total': employees.total,
         'pages': employees.pages,
         'page': page
     })
 
+@employees_bp.route('/batch', methods=['POST'])
+def get_employees_batch():
+    """Пакетное получение сотрудников по списку ID (для длинных списков)"""
+    data = request.get_json(silent=True) or {}
+    return _get_employees_batch(data.get('ids'))
+
+def _get_employees_batch(raw_ids):
+    """Загрузка сотрудников одним запросом IN с отделами, в порядке запроса"""
+    try:
+        ids = parse_ids(raw_ids)
+    except ValueError as e:
+        return jsonify({'error': str(e)}), 400
+    
+    employees = Employee.query\
+        .options(joinedload(Employee.department))\
+        .filter(Employee.id.in_(ids))\
+        .all()
+    
+    return jsonify(batch_response(ids, employees))
+
 @employees_bp.route('/<int:employee_id>', methods=['GET'])
 def get_employee(employee_id):
     """Получение информации о сотруднике по ID"""
@@ -49,6 +100,7 @@ def get_employee(employee_id):
     return jsonify(employee.to_dict())
 
 @employees_bp.route('/', methods=['POST'])
+@idempotent
 def create_employee():
     """Создание нового сотрудника"""
     data = request.get_json()
@@ -67,21 +119,29 @@ def create_employee():
     if department_id and not Department.query.get(department_id):
         return jsonify({'error': 'Department not found'}), 400
     
+    try:
+        hired_at = _parse_hired_at(data.get('hired_at'))
+    except (TypeError, ValueError):
+        return jsonify({'error': 'Invalid hired_at format. Use ISO format (YYYY-MM-DD)'}), 400
+    
     new_employee = Employee(
         first_name=data['first_name'],
         last_name=data['last_name'],
         email=data['email'],
         position=data['position'],
         department_id=department_id,
-        is_active=data.get('is_active', True)
+        is_active=data.get('is_active', True),
+        hired_at=hired_at
     )
     
     db.session.add(new_employee)
     db.session.commit()
+    on_employee_changed(new_employee.id, department_id, department_id)
     
     return jsonify(new_employee.to_dict()), 201
 
 @employees_bp.route('/<int:employee_id>', methods=['PUT'])
+@idempotent
 def update_employee(employee_id):
     """Обновление информации о сотруднике"""
     employee = Employee.query.get_or_404(employee_id)
@@ -103,28 +163,53 @@ def update_employee(employee_id):
             return jsonify({'error': 'Department not found'}), 400
         print(f"Department found: {department.name} (ID: {department.id})")
     
+    if 'hired_at' in data:
+        try:
+            data['hired_at'] = _parse_hired_at(data['hired_at'])
+        except (TypeError, ValueError):
+            return jsonify({'error': 'Invalid hired_at format. Use ISO format (YYYY-MM-DD)'}), 400
+    
+    previous_department_id = employee.department_id
+    
     # Обновление полей
-    for field in ['first_name', 'last_name', 'email', 'position', 'department_id', 'is_active']:
+    for field in ['first_name', 'last_name', 'email', 'position', 'department_id', 'is_active', 'hired_at']:
         if field in data:
             old_value = getattr(employee, field)
             setattr(employee, field, data[field])
             print(f"Updated {field}: {old_value} -> {data[field]}")
     
     try:
-        db.session.commit()
-        print(f"Successfully updated employee {employee_id}")
-        return jsonify(employee.to_dict())
+        # При смене шарда записи копируются на шард нового отдела до сохранения отдела,
+        # чтобы после сохранения они уже были там, где их будут искать
+        copied = copy_employee_records(employee_id, previous_department_id, employee.department_id)
+        try:
+            db.session.commit()
+        except Exception:
+            discard_copied_records(copied)
+            raise
     except Exception as e:
         db.session.rollback()
         print(f"Error updating employee: {str(e)}")
         return jsonify({'error': str(e)}), 500
+    
+    try:
+        # Отдел сохранен: справочники шардов и удаление записей со старого шарда
+        on_employee_changed(employee_id, previous_department_id, employee.department_id)
+    except Exception as e:
+        print(f"Error syncing shards for employee {employee_id}: {str(e)}. "
+              f"Run 'python sharding.py sync' and 'python sharding.py rebalance'")
+    
+    print(f"Successfully updated employee {employee_id}")
+    return jsonify(employee.to_dict())
 
 @employees_bp.route('/<int:employee_id>', methods=['DELETE'])
+@idempotent
 def delete_employee(employee_id):
     """Удаление сотрудника (мягкое удаление - установка is_active=False)"""
     employee = Employee.query.get_or_404(employee_id)
     employee.is_active = False
     db.session.commit()
+    on_employee_changed(employee_id, employee.department_id, employee.department_id)
     
     return jsonify({'message': 'Employee deactivated successfully'})
 
@@ -132,6 +217,7 @@ def delete_employee(employee_id):
 def get_employee_time_records(employee_id):
     """Получение записей о времени для конкретного сотрудника"""
     employee = Employee.query.get_or_404(employee_id)
+    use_employee_shard(employee_id)
     
     start_date = request.args.get('start_date')
     end_date = request.args.get('end_date')
@@ -141,14 +227,12 @@ def get_employee_time_records(employee_id):
     query = employee.time_records
     
     if start_date:
-        from datetime import datetime
         start_date = datetime.fromisoformat(start_date)
-        query = query.filter(Employee.TimeRecord.check_in >= start_date)
+        query = query.filter(TimeRecord.check_in >= start_date)
     
     if end_date:
-        from datetime import datetime
         end_date = datetime.fromisoformat(end_date)
-        query = query.filter(Employee.TimeRecord.check_in <= end_date)
+        query = query.filter(TimeRecord.check_in <= end_date)
     
     query = query.order_by(desc('check_in'))
     
@@ -164,13 +248,122 @@ def get_employee_time_records(employee_id):
         }
     })
 
+@employees_bp.route('/<int:employee_id>/timesheet', methods=['GET'])
+def get_employee_timesheet(employee_id):
+    """
+    Табель сотрудника за период: записи, итоги по дням, по неделям и общий итог.
+    Итоги считаются за один проход по результату одного запроса.
+    """
+    employee = Employee.query.get_or_404(employee_id)
+    use_employee_shard(employee_id)
+    
+    start_date = request.args.get('start_date')
+    end_date = request.args.get('end_date')
+    include_records = request.args.get('include_records', 'true').lower() == 'true'
+    
+    if not start_date or not end_date:
+        return jsonify({'error': 'Start date and end date are required'}), 400
+    
+    try:
+        start_date = datetime.fromisoformat(start_date)
+        end_date = datetime.fromisoformat(end_date)
+    except ValueError:
+        return jsonify({'error': 'Invalid date format. Use ISO format (YYYY-MM-DDTHH:MM:SS)'}), 400
+    
+    # Выбираем только нужные столбцы, без загрузки ORM-объектов
+    rows = db.session.query(
+        TimeRecord.id,
+        TimeRecord.check_in,
+        TimeRecord.check_out,
+        TimeRecord.description
+    ).filter(
+        TimeRecord.employee_id == employee_id,
+        TimeRecord.check_in >= start_date,
+        TimeRecord.check_in <= end_date
+    ).order_by(TimeRecord.check_in).yield_per(1000)
+    
+    records = []
+    days = []
+    weeks = []
+    total_seconds = 0
+    record_count = 0
+    open_records = 0
+    
+    # Записи упорядочены по check_in, поэтому дни и недели идут подряд
+    # и итог закрывается при смене ключа группы
+    for row in rows:
+        seconds = (row.check_out - row.check_in).total_seconds() if row.check_out else 0
+        day = row.check_in.date()
+        iso_year, iso_week, _ = day.isocalendar()
+        week_start = day - timedelta(days=day.weekday())
+        
+        if not days or days[-1]['date'] != day.isoformat():
+            days.append({'date': day.isoformat(), 'total_seconds': 0, 'record_count': 0})
+        days[-1]['total_seconds'] += seconds
+        days[-1]['record_count'] += 1
+        
+        if not weeks or weeks[-1]['week_start'] != week_start.isoformat():
+            weeks.append({
+                'week': f"{iso_year}-W{iso_week:02d}",
+                'week_start': week_start.isoformat(),
+                'total_seconds': 0,
+                'record_count': 0
+            })
+        weeks[-1]['total_seconds'] += seconds
+        weeks[-1]['record_count'] += 1
+        
+        total_seconds += seconds
+        record_count += 1
+        if not row.check_out:
+            open_records += 1
+        
+        if include_records:
+            records.append({
+                'id': row.id,
+                'check_in': row.check_in.isoformat(),
+                'check_out': row.check_out.isoformat() if row.check_out else None,
+                'duration_hours': round(seconds / 3600, 2),
+                'description': row.description
+            })
+    
+    for group in days + weeks:
+        group['total_hours'] = round(group.pop('total_seconds') / 3600, 2)
+    
+    response_data = {
+        'employee': employee.to_dict(),
+        'period': {
+            'start_date': start_date.isoformat(),
+            'end_date': end_date.isoformat()
+        },
+        'days': days,
+        'weeks': weeks,
+        'total': {
+            'total_hours': round(total_seconds / 3600, 2),
+            'record_count': record_count,
+            'open_records': open_records
+        }
+    }
+    if include_records:
+        response_data['records'] = records
+    
+    return jsonify(response_data)
+
 @employees_bp.route('/with-open-records', methods=['GET'])
+@replica_read
 def get_employees_with_open_records():
     """Получение списка сотрудников с открытыми записями времени"""
-    # Подзапрос для получения ID сотрудников с открытыми записями
-    employees_with_open_records = db.session.query(TimeRecord.employee_id)\
-        .filter(TimeRecord.check_out == None)\
-        .distinct()
+    if sharding_enabled():
+        # Записи на шардах: собираем ID со всех шардов, сотрудников читаем с основной базы
+        employees_with_open_records = [
+            employee_id
+            for part in fan_out(_open_record_employee_ids)
+            for employee_id in part
+        ]
+    else:
+        # Подзапрос для получения ID сотрудников с открытыми записями
+        employees_with_open_records = db.session.query(TimeRecord.employee_id)\
+            .filter(TimeRecord.check_out == None)\
+            .distinct()
     
     # Запрос для получения данных сотрудников с открытыми записями
     employees = Employee.query\
@@ -181,4 +374,10 @@ def get_employees_with_open_records():
     return jsonify({
         'items': [employee.to_dict() for employee in employees],
         'total': len(employees)
-    }) 
\ No newline at end of file
+    })
+
+def _open_record_employee_ids():
+    rows = db.session.query(TimeRecord.employee_id)\
+        .filter(TimeRecord.check_out == None)\
+        .distinct()
+    return [row.employee_id for row in rows]
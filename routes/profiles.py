@@ -0,0 +1,62 @@
+from flask import Blueprint, jsonify, current_app, send_file
+from profiling import token_valid, profiles_dir
+import json
+import os
+
+profiles_bp = Blueprint('profiles', __name__)
+
+@profiles_bp.before_request
+def check_token():
+    """Доступ к профилям только с токеном профилирования"""
+    if not token_valid():
+        return jsonify({'error': 'Invalid profiling token'}), 403
+
+def _load_profile(profile_id):
+    if not profile_id.isalnum():
+        return None
+    path = os.path.join(profiles_dir(current_app), f'{profile_id}.json')
+    try:
+        with open(path, encoding='utf-8') as f:
+            return json.load(f)
+    except (OSError, ValueError):
+        return None
+
+@profiles_bp.route('/', methods=['GET'])
+def get_profiles():
+    """Список сохраненных профилей, новые первыми"""
+    directory = profiles_dir(current_app)
+    items = []
+    if os.path.isdir(directory):
+        for name in os.listdir(directory):
+            if not name.endswith('.json'):
+                continue
+            profile = _load_profile(name[:-len('.json')])
+            if profile:
+                items.append({
+                    key: profile[key] for key in (
+                        'id', 'created_at', 'method', 'path', 'endpoint', 'status',
+                        'duration_ms', 'trigger', 'sql_count', 'sql_duration_ms'
+                    )
+                })
+    items.sort(key=lambda item: item['created_at'], reverse=True)
+    
+    return jsonify({
+        'items': items,
+        'total': len(items)
+    })
+
+@profiles_bp.route('/<profile_id>', methods=['GET'])
+def get_profile(profile_id):
+    """Профиль запроса: хронология SQL и самые затратные функции"""
+    profile = _load_profile(profile_id)
+    if not profile:
+        return jsonify({'error': 'Profile not found'}), 404
+    return jsonify(profile)
+
+@profiles_bp.route('/<profile_id>/download', methods=['GET'])
+def download_profile(profile_id):
+    """Скачивание данных cProfile (открываются pstats, snakeviz и т.п.)"""
+    if not _load_profile(profile_id):
+        return jsonify({'error': 'Profile not found'}), 404
+    path = os.path.join(profiles_dir(current_app), f'{profile_id}.prof')
+    return send_file(path, as_attachment=True, download_name=f'{profile_id}.prof')
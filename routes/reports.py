@@ -1,29 +1,108 @@
-from flask import Blueprint, request, jsonify
+from flask import Blueprint, request, jsonify, current_app, send_file, Response, stream_with_context
 from models import db, TimeRecord, Employee, Department
 from sqlalchemy import func, desc, cast, Date
+from sqlalchemy.orm import contains_eager
 from datetime import datetime, timedelta
 import csv
+import heapq
 import io
+from operator import itemgetter
+from replica import use_replica
+from payroll import DEFAULT_PAYROLL_RULES, build_rules, parse_period_end, run_payroll
+from report_jobs import STATUS_DONE, register_report_type, serialize_job
+from analytics import NO_DEPARTMENT
+from routes.utils import parse_fields
+from sharding import sharding_enabled, collect, keyed_items, merge_ordered
+from attendance import find_gaps, csv_lines
 
 reports_bp = Blueprint('reports', __name__)
 
+# Все отчеты только читают данные и выполняются на реплике
+reports_bp.before_request(use_replica)
+
+# Отчеты разделены на разбор параметров (*_params: ValueError с текстом ошибки
+# для ответа 400) и построение (*_report). Эндпоинты и фоновые задачи
+# (report_jobs.py) вызывают одни и те же функции; параметры задачи проверяются
+# при постановке в очередь.
+
+def _int_arg(args, key, default=None):
+    """Целый параметр; некорректное значение игнорируется, как в request.args.get(type=int)"""
+    try:
+        return int(args[key]) if args.get(key) not in (None, '') else default
+    except (TypeError, ValueError):
+        return default
+
+def _period(args, parse_start=datetime.fromisoformat, parse_end=datetime.fromisoformat,
+            error='Invalid date format. Use ISO format (YYYY-MM-DDTHH:MM:SS)'):
+    """Обязательный период start_date - end_date"""
+    start_date = args.get('start_date')
+    end_date = args.get('end_date')
+    if not start_date or not end_date:
+        raise ValueError('Start date and end date are required')
+    try:
+        return parse_start(start_date), parse_end(end_date)
+    except ValueError:
+        raise ValueError(error)
+
+def _report_response(parse_params, build, args):
+    """JSON-ответ отчета или 400 при некорректных параметрах"""
+    try:
+        params = parse_params(args)
+    except ValueError as e:
+        return jsonify({'error': str(e)}), 400
+    return jsonify(build(params))
+
+def summary_params(args):
+    start_date, end_date = _period(args)
+    return {
+        'start_date': start_date,
+        'end_date': end_date,
+        'department_id': _int_arg(args, 'department_id'),
+        'group_by': args.get('group_by') or 'employee',  # employee, department, date
+    }
+
 @reports_bp.route('/summary', methods=['GET'])
 def get_summary_report():
     """Получение общего отчета по рабочему времени"""
-    start_date = request.args.get('start_date')
-    end_date = request.args.get('end_date')
-    department_id = request.args.get('department_id', type=int)
-    group_by = request.args.get('group_by', 'employee')  # employee, department, date
+    return _report_response(summary_params, summary_report, request.args)
+
+def summary_report(params):
+    """Общий отчет по рабочему времени"""
+    start_date = params['start_date']
+    end_date = params['end_date']
+    department_id = params['department_id']
+    group_by = params['group_by']
     
-    if not start_date or not end_date:
-        return jsonify({'error': 'Start date and end date are required'}), 400
+    # Без шардирования одна часть; с шардированием - по части с каждого шарда
+    parts = collect(_summary_rows, (start_date, end_date, department_id, group_by), department_id)
     
-    try:
-        start_date = datetime.fromisoformat(start_date)
-        end_date = datetime.fromisoformat(end_date)
-    except ValueError:
-        return jsonify({'error': 'Invalid date format. Use ISO format (YYYY-MM-DDTHH:MM:SS)'}), 400
+    if group_by == 'department':
+        # Частичные итоги одного отдела с разных шардов складываются
+        by_department = {}
+        for item in (item for part in parts for item in part):
+            merged = by_department.setdefault(item['department_id'], item)
+            if merged is not item:
+                merged['total_hours'] += item['total_hours']
+                merged['record_count'] += item['record_count']
+        response_data = list(by_department.values())
+    else:
+        # Записи сотрудника хранятся на одном шарде, группы не пересекаются
+        response_data = [item for part in parts for item in part]
+    
+    for item in response_data:
+        item['total_hours'] = round(item['total_hours'], 2)
     
+    return {
+        'period': {
+            'start_date': start_date.isoformat(),
+            'end_date': end_date.isoformat()
+        },
+        'group_by': group_by,
+        'data': response_data
+    }
+
+def _summary_rows(start_date, end_date, department_id, group_by):
+    """Строки общего отчета (часы не округлены, чтобы части можно было сложить)"""
     query = db.session.query(
         TimeRecord.employee_id,
         Employee.first_name,
@@ -73,51 +152,74 @@ def get_summary_report():
             Department.name
         )
     
-    results = query.all()
-    
-    response_data = []
-    for row in results:
-        item = {
+    return [
+        {
             'employee_id': row.employee_id,
             'employee_name': f"{row.first_name} {row.last_name}",
             'department_id': row.department_id,
             'department_name': row.department_name,
-            'total_hours': round(row.total_hours, 2),
+            'total_hours': row.total_hours,
             'record_count': row.record_count
         }
-        response_data.append(item)
-    
-    return jsonify({
-        'period': {
-            'start_date': start_date.isoformat(),
-            'end_date': end_date.isoformat()
-        },
-        'group_by': group_by,
-        'data': response_data
-    })
+        for row in query
+    ]
 
-@reports_bp.route('/daily', methods=['GET'])
-def get_daily_report():
-    """Получение ежедневного отчета по рабочему времени"""
-    employee_id = request.args.get('employee_id', type=int)
-    department_id = request.args.get('department_id', type=int)
-    date = request.args.get('date')
-    
+def daily_params(args):
+    date = args.get('date')
     if not date:
         date = datetime.now().date().isoformat()
     
     try:
         report_date = datetime.fromisoformat(date).date()
-        start_date = datetime.combine(report_date, datetime.min.time())
-        end_date = datetime.combine(report_date, datetime.max.time())
     except ValueError:
-        return jsonify({'error': 'Invalid date format. Use ISO format (YYYY-MM-DD)'}), 400
+        raise ValueError('Invalid date format. Use ISO format (YYYY-MM-DD)')
     
-    query = db.session.query(
-        TimeRecord
-    ).join(
-        Employee, TimeRecord.employee_id == Employee.id
-    ).filter(
+    return {
+        'date': date,
+        'start_date': datetime.combine(report_date, datetime.min.time()),
+        'end_date': datetime.combine(report_date, datetime.max.time()),
+        'employee_id': _int_arg(args, 'employee_id'),
+        'department_id': _int_arg(args, 'department_id'),
+        'fields': parse_fields(args.get('fields'), TimeRecord.SPARSE_FIELDS),
+    }
+
+@reports_bp.route('/daily', methods=['GET'])
+def get_daily_report():
+    """Получение ежедневного отчета по рабочему времени"""
+    return _report_response(daily_params, daily_report, request.args)
+
+def daily_report(params):
+    """Ежедневный отчет по рабочему времени"""
+    department_id = params['department_id']
+    args = (params['start_date'], params['end_date'], params['employee_id'], department_id, params['fields'])
+    if sharding_enabled():
+        # Каждый шард отдает записи по порядку прихода, части сливаются
+        items = merge_ordered(collect(_daily_items, args + (True,), department_id))
+    else:
+        items = _daily_items(*args)
+    
+    return {
+        'date': params['date'],
+        'records': items
+    }
+
+def _daily_items(start_date, end_date, employee_id, department_id, fields, keyed=False):
+    """Записи ежедневного отчета; keyed - пары (время прихода, запись) для слияния шардов"""
+    if fields:
+        # Только запрошенные столбцы; сотрудник нужен лишь для имени или фильтра по отделу
+        query, joined_employee = TimeRecord.sparse_query(fields)
+        if department_id and not joined_employee:
+            query = query.join(Employee, TimeRecord.employee_id == Employee.id)
+    else:
+        query = db.session.query(
+            TimeRecord
+        ).join(
+            Employee, TimeRecord.employee_id == Employee.id
+        ).options(
+            contains_eager(TimeRecord.employee)
+        )
+    
+    query = query.filter(
         TimeRecord.check_in >= start_date,
         TimeRecord.check_in <= end_date
     )
@@ -128,29 +230,96 @@ def get_daily_report():
     if department_id:
         query = query.filter(Employee.department_id == department_id)
     
-    records = query.order_by(TimeRecord.check_in).all()
+    query = query.order_by(TimeRecord.check_in)
+    if keyed:
+        return keyed_items(query, fields)
     
-    return jsonify({
-        'date': date,
-        'records': [record.to_dict() for record in records]
+    if fields:
+        return [TimeRecord.sparse_dict(row, fields) for row in query]
+    return [record.to_dict() for record in query]
+
+def payroll_params(args):
+    # Дата без времени в конце периода включает весь день, как в payroll.py
+    start_date, end_date = _period(args, parse_end=parse_period_end)
+    # Правила: значения по умолчанию, затем конфигурация приложения, затем параметры запроса
+    rules = build_rules(current_app.config.get('PAYROLL_RULES'))
+    rules = build_rules({
+        **rules,
+        **{key: args.get(key) for key in DEFAULT_PAYROLL_RULES}
     })
+    return {
+        'start_date': start_date,
+        'end_date': end_date,
+        'department_id': _int_arg(args, 'department_id'),
+        'rules': rules,
+    }
+
+@reports_bp.route('/payroll', methods=['GET'])
+def get_payroll_report():
+    """Отчет по сверхурочным, ночным часам и нарушениям отдыха за период"""
+    return _report_response(payroll_params, payroll_report, request.args)
+
+def payroll_report(params):
+    """Сверхурочные, ночные часы и нарушения отдыха за период"""
+    start_date = params['start_date']
+    end_date = params['end_date']
+    department_id = params['department_id']
+    rules = params['rules']
+    
+    # Расчёт в пуле процессов только из командной строки (payroll.py --workers):
+    # в HTTP-запросе пул процессов на каждый вызов слишком дорог
+    parts = collect(_payroll_rows, (start_date, end_date, department_id, rules), department_id)
+    # Сотрудник целиком на одном шарде, части только упорядочиваются
+    results = sorted((item for part in parts for item in part), key=lambda item: item['employee_id'])
+    
+    names_query = db.session.query(Employee.id, Employee.first_name, Employee.last_name)
+    if department_id:
+        names_query = names_query.filter(Employee.department_id == department_id)
+    names = dict((row.id, f"{row.first_name} {row.last_name}") for row in names_query)
+    for item in results:
+        item['employee_name'] = names.get(item['employee_id'])
+    
+    return {
+        'period': {
+            'start_date': start_date.isoformat(),
+            'end_date': end_date.isoformat()
+        },
+        'rules': rules,
+        'data': results
+    }
+
+def _payroll_rows(start_date, end_date, department_id, rules):
+    return run_payroll(db.session, start_date, end_date, department_id=department_id, rules=rules)
+
+def export_params(args):
+    start_date, end_date = _period(args)
+    return {
+        'type': args.get('type') or 'summary',
+        'start_date': start_date,
+        'end_date': end_date,
+        'department_id': _int_arg(args, 'department_id'),
+    }
 
 @reports_bp.route('/export/csv', methods=['GET'])
 def export_csv():
     """Экспорт данных в формате CSV"""
-    report_type = request.args.get('type', 'summary')
-    start_date = request.args.get('start_date')
-    end_date = request.args.get('end_date')
-    department_id = request.args.get('department_id', type=int)
-    
-    if not start_date or not end_date:
-        return jsonify({'error': 'Start date and end date are required'}), 400
-    
     try:
-        start_date = datetime.fromisoformat(start_date)
-        end_date = datetime.fromisoformat(end_date)
-    except ValueError:
-        return jsonify({'error': 'Invalid date format. Use ISO format (YYYY-MM-DDTHH:MM:SS)'}), 400
+        params = export_params(request.args)
+    except ValueError as e:
+        return jsonify({'error': str(e)}), 400
+    
+    filename, lines = export_csv_report(params)
+    return jsonify({
+        'csv_data': ''.join(lines),
+        'filename': filename
+    })
+
+def export_csv_report(params):
+    """Экспорт в CSV: имя файла и строки"""
+    report_type = params['type']
+    start_date = params['start_date']
+    end_date = params['end_date']
+    department_id = params['department_id']
     
     # Создаем CSV в памяти
     csv_buffer = io.StringIO()
@@ -163,51 +332,9 @@ def export_csv():
             'Всего часов', 'Количество записей'
         ])
         
-        # Получаем данные
-        query = db.session.query(
-            TimeRecord.employee_id,
-            Employee.first_name,
-            Employee.last_name,
-            Department.name.label('department_name'),
-            func.sum(
-                func.coalesce(
-                    func.extract('epoch', TimeRecord.check_out - TimeRecord.check_in),
-                    0
-                ) / 3600
-            ).label('total_hours'),
-            func.count(TimeRecord.id).label('record_count')
-        ).join(
-            Employee, TimeRecord.employee_id == Employee.id
-        ).outerjoin(
-            Department, Employee.department_id == Department.id
-        ).filter(
-            TimeRecord.check_in >= start_date,
-            TimeRecord.check_in <= end_date,
-            TimeRecord.check_out != None
-        )
-        
-        if department_id:
-            query = query.filter(Employee.department_id == department_id)
-        
-        query = query.group_by(
-            TimeRecord.employee_id,
-            Employee.first_name,
-            Employee.last_name,
-            Department.name
-        )
-        
-        results = query.all()
-        
-        # Записываем данные
-        for row in results:
-            csv_writer.writerow([
-                row.employee_id,
-                row.first_name,
-                row.last_name,
-                row.department_name or 'Не указан',
-                round(row.total_hours, 2),
-                row.record_count
-            ])
+        # Получаем данные (сотрудник целиком на одном шарде, части не пересекаются)
+        for part in collect(_export_summary_rows, (start_date, end_date, department_id), department_id):
+            csv_writer.writerows(part)
     
     elif report_type == 'detailed':
         # Заголовки CSV
@@ -216,50 +343,306 @@ def export_csv():
             'Время начала', 'Время окончания', 'Часов', 'Описание'
         ])
         
-        # Получаем данные
-        query = db.session.query(
-            TimeRecord.id,
-            Employee.first_name,
-            Employee.last_name,
-            Department.name.label('department_name'),
-            TimeRecord.check_in,
-            TimeRecord.check_out,
-            (func.extract('epoch', TimeRecord.check_out - TimeRecord.check_in) / 3600).label('hours'),
-            TimeRecord.description
-        ).join(
-            Employee, TimeRecord.employee_id == Employee.id
-        ).outerjoin(
-            Department, Employee.department_id == Department.id
-        ).filter(
-            TimeRecord.check_in >= start_date,
-            TimeRecord.check_in <= end_date,
-            TimeRecord.check_out != None
-        )
-        
-        if department_id:
-            query = query.filter(Employee.department_id == department_id)
-        
-        results = query.order_by(TimeRecord.check_in).all()
-        
-        # Записываем данные
-        for row in results:
-            csv_writer.writerow([
-                row.id,
-                f"{row.first_name} {row.last_name}",
-                row.department_name or 'Не указан',
-                row.check_in.strftime('%Y-%m-%d %H:%M:%S'),
-                row.check_out.strftime('%Y-%m-%d %H:%M:%S') if row.check_out else '',
-                round(row.hours, 2) if row.hours else 0,
-                row.description or ''
-            ])
-    
-    # Подготавливаем ответ
+        # Получаем данные: части с шардов сливаются по времени начала
+        parts = collect(_export_detailed_rows, (start_date, end_date, department_id), department_id)
+        csv_writer.writerows(heapq.merge(*parts, key=itemgetter(3)))
+    
     csv_content = csv_buffer.getvalue()
     csv_buffer.close()
     
-    response = jsonify({
-        'csv_data': csv_content,
-        'filename': f"time_tracking_{report_type}_{start_date.strftime('%Y%m%d')}-{end_date.strftime('%Y%m%d')}.csv"
+    filename = f"time_tracking_{report_type}_{start_date.strftime('%Y%m%d')}-{end_date.strftime('%Y%m%d')}.csv"
+    return filename, [csv_content]
+
+def _export_summary_rows(start_date, end_date, department_id):
+    """Строки CSV сводного экспорта"""
+    query = db.session.query(
+        TimeRecord.employee_id,
+        Employee.first_name,
+        Employee.last_name,
+        Department.name.label('department_name'),
+        func.sum(
+            func.coalesce(
+                func.extract('epoch', TimeRecord.check_out - TimeRecord.check_in),
+                0
+            ) / 3600
+        ).label('total_hours'),
+        func.count(TimeRecord.id).label('record_count')
+    ).join(
+        Employee, TimeRecord.employee_id == Employee.id
+    ).outerjoin(
+        Department, Employee.department_id == Department.id
+    ).filter(
+        TimeRecord.check_in >= start_date,
+        TimeRecord.check_in <= end_date,
+        TimeRecord.check_out != None
+    )
+    
+    if department_id:
+        query = query.filter(Employee.department_id == department_id)
+    
+    query = query.group_by(
+        TimeRecord.employee_id,
+        Employee.first_name,
+        Employee.last_name,
+        Department.name
+    )
+    
+    return [
+        [
+            row.employee_id,
+            row.first_name,
+            row.last_name,
+            row.department_name or 'Не указан',
+            round(row.total_hours, 2),
+            row.record_count
+        ]
+        for row in query
+    ]
+
+def _export_detailed_rows(start_date, end_date, department_id):
+    """Строки CSV детального экспорта, упорядоченные по времени начала"""
+    query = db.session.query(
+        TimeRecord.id,
+        Employee.first_name,
+        Employee.last_name,
+        Department.name.label('department_name'),
+        TimeRecord.check_in,
+        TimeRecord.check_out,
+        (func.extract('epoch', TimeRecord.check_out - TimeRecord.check_in) / 3600).label('hours'),
+        TimeRecord.description
+    ).join(
+        Employee, TimeRecord.employee_id == Employee.id
+    ).outerjoin(
+        Department, Employee.department_id == Department.id
+    ).filter(
+        TimeRecord.check_in >= start_date,
+        TimeRecord.check_in <= end_date,
+        TimeRecord.check_out != None
+    )
+    
+    if department_id:
+        query = query.filter(Employee.department_id == department_id)
+    
+    return [
+        [
+            row.id,
+            f"{row.first_name} {row.last_name}",
+            row.department_name or 'Не указан',
+            row.check_in.strftime('%Y-%m-%d %H:%M:%S'),
+            row.check_out.strftime('%Y-%m-%d %H:%M:%S') if row.check_out else '',
+            round(row.hours, 2) if row.hours else 0,
+            row.description or ''
+        ]
+        for row in query.order_by(TimeRecord.check_in)
+    ]
+
+def _parse_date(value):
+    return datetime.fromisoformat(value).date()
+
+def attendance_params(args):
+    start_date, end_date = _period(args, _parse_date, _parse_date,
+                                   error='Invalid date format. Use ISO format (YYYY-MM-DD)')
+    grace_minutes = _int_arg(args, 'grace_minutes', current_app.config.get('ATTENDANCE_GRACE_MINUTES', 0))
+    if grace_minutes < 0:
+        raise ValueError('grace_minutes must not be negative')
+    return {
+        'start_date': start_date,
+        'end_date': end_date,
+        'department_id': _int_arg(args, 'department_id'),
+        'grace_minutes': grace_minutes,
+    }
+
+@reports_bp.route('/attendance', methods=['GET'])
+def get_attendance_report():
+    """
+    Пропуски и опоздания активных сотрудников по рабочим дням календаря за период.
+    Отдается потоковым CSV, строки формируются по мере чтения результата запроса.
+    """
+    try:
+        params = attendance_params(request.args)
+    except ValueError as e:
+        return jsonify({'error': str(e)}), 400
+    
+    filename, lines = attendance_report(params)
+    return Response(
+        stream_with_context(lines),
+        mimetype='text/csv',
+        headers={'Content-Disposition': f'attachment; filename={filename}'}
+    )
+
+def attendance_report(params):
+    """Отчет о пропусках и опозданиях: имя файла и строки CSV (генератор)"""
+    start_date = params['start_date']
+    end_date = params['end_date']
+    department_id = params['department_id']
+    grace_minutes = params['grace_minutes']
+    
+    if sharding_enabled():
+        # Каждый шард считает своих сотрудников, части сливаются по дате и сотруднику
+        parts = collect(_attendance_part, (start_date, end_date, department_id, grace_minutes), department_id)
+        gaps = heapq.merge(*parts, key=itemgetter('date', 'employee_id'))
+    else:
+        gaps = find_gaps(start_date, end_date, department_id, grace_minutes)
+    
+    filename = f"attendance_{start_date.strftime('%Y%m%d')}-{end_date.strftime('%Y%m%d')}.csv"
+    return filename, csv_lines(gaps)
+
+def _attendance_part(start_date, end_date, department_id, grace_minutes):
+    return list(find_gaps(start_date, end_date, department_id, grace_minutes, shard_only=True))
+
+# Отчеты, доступные для фонового выполнения: JSON или файл CSV
+register_report_type('summary', summary_params, summary_report)
+register_report_type('daily', daily_params, daily_report)
+register_report_type('payroll', payroll_params, payroll_report)
+register_report_type('export_csv', export_params, export_csv_report, csv=True)
+register_report_type('attendance', attendance_params, attendance_report, csv=True)
+
+@reports_bp.route('/jobs', methods=['POST'])
+def create_report_job():
+    """Постановка отчета в фоновую очередь"""
+    data = request.get_json(silent=True) or {}
+    report_type = data.get('type')
+    params = data.get('params', {})
+    
+    if not report_type:
+        return jsonify({'error': 'Report type is required'}), 400
+    if not isinstance(params, dict):
+        return jsonify({'error': 'Params must be an object'}), 400
+    
+    try:
+        job, created = current_app.extensions['report_jobs'].submit(report_type, params)
+    except ValueError as e:
+        return jsonify({'error': str(e)}), 400
+    
+    return jsonify(serialize_job(job)), 202 if created else 200
+
+@reports_bp.route('/jobs/<job_id>', methods=['GET'])
+def get_report_job(job_id):
+    """Получение состояния фоновой задачи"""
+    job = current_app.extensions['report_jobs'].get(job_id)
+    if not job:
+        return jsonify({'error': 'Job not found or expired'}), 404
+    return jsonify(serialize_job(job))
+
+@reports_bp.route('/jobs/<job_id>/download', methods=['GET'])
+def download_report_job(job_id):
+    """Скачивание результата фоновой задачи"""
+    manager = current_app.extensions['report_jobs']
+    job = manager.get(job_id)
+    if not job:
+        return jsonify({'error': 'Job not found or expired'}), 404
+    if job['status'] != STATUS_DONE:
+        return jsonify({'error': 'Job is not finished', 'status': job['status']}), 409
+    
+    return send_file(manager.result_path(job), as_attachment=True, download_name=job['filename'])
+
+def _get_analytics():
+    """Колоночное хранилище с дочитанными изменениями или None, если оно выключено"""
+    store = current_app.extensions.get('analytics')
+    if store is not None:
+        store.refresh(max_age=current_app.config.get('ANALYTICS_REFRESH_SECONDS', 5))
+    return store
+
+@reports_bp.route('/analytics/summary', methods=['GET'])
+def get_analytics_summary():
+    """Сводный отчет из колоночного хранилища в памяти"""
+    store = _get_analytics()
+    if store is None:
+        return jsonify({'error': 'Analytics store is disabled'}), 503
+    
+    start_date = request.args.get('start_date')
+    end_date = request.args.get('end_date')
+    department_id = request.args.get('department_id', type=int)
+    group_by = request.args.get('group_by', 'employee')  # employee, department, date
+    
+    if not start_date or not end_date:
+        return jsonify({'error': 'Start date and end date are required'}), 400
+    if group_by not in ('employee', 'department', 'date'):
+        return jsonify({'error': 'group_by must be one of: employee, department, date'}), 400
+    
+    try:
+        start_date = datetime.fromisoformat(start_date)
+        end_date = datetime.fromisoformat(end_date)
+    except ValueError:
+        return jsonify({'error': 'Invalid date format. Use ISO format (YYYY-MM-DDTHH:MM:SS)'}), 400
+    
+    groups = store.group_totals(start_date, end_date, group_by=group_by, department_id=department_id)
+    
+    departments = dict(db.session.query(Department.id, Department.name))
+    response_data = []
+    if group_by == 'employee':
+        employees = db.session.query(
+            Employee.id, Employee.first_name, Employee.last_name, Employee.department_id
+        ).filter(Employee.id.in_(list(groups))).all() if groups else []
+        employees = {row.id: row for row in employees}
+        for employee_id in sorted(groups):
+            seconds, record_count = groups[employee_id]
+            employee = employees.get(employee_id)
+            response_data.append({
+                'employee_id': employee_id,
+                'employee_name': f"{employee.first_name} {employee.last_name}" if employee else None,
+                'department_id': employee.department_id if employee else None,
+                'department_name': departments.get(employee.department_id) if employee else None,
+                'total_hours': round(seconds / 3600, 2),
+                'record_count': record_count
+            })
+    elif group_by == 'department':
+        for key in sorted(groups):
+            seconds, record_count = groups[key]
+            department_id = key if key != NO_DEPARTMENT else None
+            response_data.append({
+                'department_id': department_id,
+                'department_name': departments.get(department_id),
+                'total_hours': round(seconds / 3600, 2),
+                'record_count': record_count
+            })
+    else:
+        for day in sorted(groups):
+            seconds, record_count = groups[day]
+            response_data.append({
+                'date': day.isoformat(),
+                'total_hours': round(seconds / 3600, 2),
+                'record_count': record_count
+            })
+    
+    return jsonify({
+        'period': {
+            'start_date': start_date.isoformat(),
+            'end_date': end_date.isoformat()
+        },
+        'group_by': group_by,
+        'data': response_data
     })
+
+@reports_bp.route('/analytics/totals', methods=['GET'])
+def get_analytics_totals():
+    """Итог часов и записей за период из колоночного хранилища"""
+    store = _get_analytics()
+    if store is None:
+        return jsonify({'error': 'Analytics store is disabled'}), 503
+    
+    start_date = request.args.get('start_date')
+    end_date = request.args.get('end_date')
+    employee_id = request.args.get('employee_id', type=int)
+    department_id = request.args.get('department_id', type=int)
+    
+    if not start_date or not end_date:
+        return jsonify({'error': 'Start date and end date are required'}), 400
+    
+    try:
+        start_date = datetime.fromisoformat(start_date)
+        end_date = datetime.fromisoformat(end_date)
+    except ValueError:
+        return jsonify({'error': 'Invalid date format. Use ISO format (YYYY-MM-DDTHH:MM:SS)'}), 400
     
-    return response 
\ No newline at end of file
+    seconds, record_count = store.totals(start_date, end_date, employee_id, department_id)
+    
+    return jsonify({
+        'period': {
+            'start_date': start_date.isoformat(),
+            'end_date': end_date.isoformat()
+        },
+        'total_hours': round(seconds / 3600, 2),
+        'record_count': record_count,
+        'average_hours': round(seconds / 3600 / record_count, 2) if record_count else 0
+    })
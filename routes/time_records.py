@@ -1,51 +1,163 @@
-from flask import Blueprint, request, jsonify, current_app
+from flask import Blueprint, request, jsonify, current_app, abort
 from models import db, TimeRecord, Employee
 from datetime import datetime
+from math import ceil
 from sqlalchemy import desc
-from routes.utils import get_moscow_time, utc_to_moscow, moscow_to_utc
+from sqlalchemy.orm import joinedload
+from replica import replica_read
+from idempotency import idempotent
+from sharding import (
+    sharding_enabled, use_employee_shard, use_record_shard, locate_record, assign_record_id,
+    fan_out, keyed_items, merge_ordered
+)
+from routes.utils import get_moscow_time, utc_to_moscow, moscow_to_utc, parse_ids, batch_response, parse_fields
 
 time_records_bp = Blueprint('time_records', __name__)
 
+# Предельный размер страницы списка с шардированием: каждый шард отдает page * per_page записей
+MAX_PER_PAGE = 100
+
 @time_records_bp.route('/', methods=['GET'])
+@replica_read
 def get_time_records():
     """Получение списка записей рабочего времени с возможностью фильтрации"""
+    if 'ids' in request.args:
+        return _get_time_records_batch(request.args.get('ids'))
+    
     employee_id = request.args.get('employee_id', type=int)
     start_date = request.args.get('start_date')
     end_date = request.args.get('end_date')
     page = request.args.get('page', 1, type=int)
     per_page = request.args.get('per_page', 20, type=int)
     
-    query = TimeRecord.query
-    
-    if employee_id:
-        query = query.filter(TimeRecord.employee_id == employee_id)
+    try:
+        fields = parse_fields(request.args.get('fields'), TimeRecord.SPARSE_FIELDS)
+    except ValueError as e:
+        return jsonify({'error': str(e)}), 400
     
     if start_date:
         start_date = datetime.fromisoformat(start_date)
-        query = query.filter(TimeRecord.check_in >= start_date)
     
     if end_date:
         end_date = datetime.fromisoformat(end_date)
-        query = query.filter(TimeRecord.check_in <= end_date)
     
-    query = query.order_by(desc(TimeRecord.check_in))
+    if employee_id:
+        # Все записи сотрудника на одном шарде
+        use_employee_shard(employee_id)
+    elif sharding_enabled():
+        return _get_sharded_time_records(start_date, end_date, fields, page, per_page)
+    
+    query = _time_records_query(employee_id, start_date, end_date, fields)
     
     records = query.paginate(page=page, per_page=per_page)
     
+    if fields:
+        items = [TimeRecord.sparse_dict(row, fields) for row in records.items]
+    else:
+        items = [record.to_dict() for record in records.items]
+    
     return jsonify({
-        'items': [record.to_dict() for record in records.items],
+        'items': items,
         'total': records.total,
         'pages': records.pages,
         'page': page
     })
 
+def _time_records_query(employee_id, start_date, end_date, fields):
+    """Запрос списка записей, упорядоченный от новых к старым"""
+    if fields:
+        # Только запрошенные столбцы, без лишних соединений
+        query, _ = TimeRecord.sparse_query(fields)
+    else:
+        query = TimeRecord.query.options(joinedload(TimeRecord.employee))
+    
+    if employee_id:
+        query = query.filter(TimeRecord.employee_id == employee_id)
+    
+    if start_date:
+        query = query.filter(TimeRecord.check_in >= start_date)
+    
+    if end_date:
+        query = query.filter(TimeRecord.check_in <= end_date)
+    
+    return query.order_by(desc(TimeRecord.check_in))
+
+def _shard_time_records_page(start_date, end_date, fields, limit):
+    """Первые limit записей и их общее число на одном шарде"""
+    query = _time_records_query(None, start_date, end_date, fields)
+    return query.order_by(None).count(), keyed_items(query, fields, limit)
+
+def _get_sharded_time_records(start_date, end_date, fields, page, per_page):
+    """
+    Страница списка со всех шардов: каждый шард отдает свои первые page * per_page
+    записей, они сливаются по времени прихода, и из результата берется страница.
+    """
+    # Те же проверки, что у paginate, и предельный размер страницы
+    per_page = min(per_page, MAX_PER_PAGE)
+    if page < 1 or per_page < 1:
+        abort(404)
+    
+    parts = fan_out(_shard_time_records_page, (start_date, end_date, fields, page * per_page))
+    total = sum(count for count, _ in parts)
+    items = merge_ordered([items for _, items in parts], reverse=True)[(page - 1) * per_page:page * per_page]
+    if not items and page != 1:
+        abort(404)
+    
+    return jsonify({
+        'items': items,
+        'total': total,
+        'pages': ceil(total / per_page),
+        'page': page
+    })
+
+@time_records_bp.route('/batch', methods=['POST'])
+def get_time_records_batch():
+    """Пакетное получение записей по списку ID (для длинных списков)"""
+    data = request.get_json(silent=True) or {}
+    return _get_time_records_batch(data.get('ids'))
+
+def _get_time_records_batch(raw_ids):
+    """Загрузка записей одним запросом IN с сотрудниками, в порядке запроса"""
+    try:
+        ids = parse_ids(raw_ids)
+    except ValueError as e:
+        return jsonify({'error': str(e)}), 400
+    
+    if sharding_enabled():
+        # ID не пересекаются между шардами; копия записи, еще не удаленная после
+        # переноса, может вернуться дважды, batch_response оставит одну
+        records = [item for part in fan_out(_load_time_records, (ids,)) for item in part]
+    else:
+        records = _load_time_records(ids)
+    
+    return jsonify(batch_response(ids, records))
+
+def _load_time_records(ids):
+    records = TimeRecord.query\
+        .options(joinedload(TimeRecord.employee))\
+        .filter(TimeRecord.id.in_(ids))\
+        .all()
+    return [record.to_dict() for record in records]
+
+def _get_time_record_or_404(record_id):
+    """Запись по ID с ее шарда; перенесенная на другой шард запись ищется на всех шардах"""
+    if not use_record_shard(record_id):
+        abort(404)
+    record = TimeRecord.query.get(record_id)
+    if record is None and sharding_enabled() and locate_record(record_id):
+        record = TimeRecord.query.get(record_id)
+    if record is None:
+        abort(404)
+    return record
+
 @time_records_bp.route('/<int:record_id>', methods=['GET'])
 def get_time_record(record_id):
     """Получение детальной информации о записи по ID"""
-    record = TimeRecord.query.get_or_404(record_id)
+    record = _get_time_record_or_404(record_id)
     return jsonify(record.to_dict())
 
 @time_records_bp.route('/', methods=['POST'])
+@idempotent
 def create_time_record():
     """Создание новой записи о рабочем времени (регистрация прихода)"""
     data = request.get_json()
@@ -59,6 +171,8 @@ def create_time_record():
     if not employee:
         return jsonify({'error': 'Employee not found'}), 404
     
+    use_employee_shard(employee_id)
+    
     # Проверка на открытую запись для сотрудника
     open_record = TimeRecord.query.filter_by(
         employee_id=employee_id, 
@@ -83,6 +197,7 @@ def create_time_record():
         check_in=check_in,
         description=data.get('description', '')
     )
+    assign_record_id(new_record)
     
     db.session.add(new_record)
     db.session.commit()
@@ -90,9 +205,10 @@ def create_time_record():
     return jsonify(new_record.to_dict()), 201
 
 @time_records_bp.route('/<int:record_id>', methods=['PUT'])
+@idempotent
 def update_time_record(record_id):
     """Обновление записи (включая регистрацию ухода)"""
-    record = TimeRecord.query.get_or_404(record_id)
+    record = _get_time_record_or_404(record_id)
     data = request.get_json()
     
     if 'check_out' in data and data['check_out']:
@@ -115,6 +231,7 @@ def update_time_record(record_id):
     return jsonify(record.to_dict())
 
 @time_records_bp.route('/check-in', methods=['POST'])
+@idempotent
 def check_in():
     """Отметка о приходе сотрудника"""
     data = request.get_json()
@@ -123,6 +240,8 @@ def check_in():
     if not employee_id:
         return jsonify({'error': 'Employee ID is required'}), 400
     
+    use_employee_shard(employee_id)
+    
     # Проверка на открытую запись
     open_record = TimeRecord.query.filter_by(
         employee_id=employee_id, 
@@ -143,6 +262,7 @@ def check_in():
         check_in=moscow_time,  # Используем московское время
         description=data.get('description', '')
     )
+    assign_record_id(new_record)
     
     db.session.add(new_record)
     db.session.commit()
@@ -150,6 +270,7 @@ def check_in():
     return jsonify(new_record.to_dict()), 201
 
 @time_records_bp.route('/check-out', methods=['POST'])
+@idempotent
 def check_out():
     """Отметка об уходе сотрудника"""
     data = request.get_json()
@@ -158,6 +279,8 @@ def check_out():
     if not employee_id:
         return jsonify({'error': 'ID сотрудника не указан'}), 400
     
+    use_employee_shard(employee_id)
+    
     # Находим открытую запись
     record = TimeRecord.query.filter_by(
         employee_id=employee_id, 
@@ -23,4 +23,88 @@ def moscow_to_utc(moscow_time):
     """
     if not moscow_time:
         return None
-    return moscow_time - timedelta(hours=MOSCOW_TIMEZONE_OFFSET) 
\ No newline at end of file
+    return moscow_time - timedelta(hours=MOSCOW_TIMEZONE_OFFSET) 
+
+# Максимальное количество ID в одном пакетном запросе
+MAX_BATCH_IDS = 500
+
+def parse_ids(raw_ids):
+    """
+    Разбирает список ID из строки вида "1,2,3" или из JSON-массива.
+    Сохраняет порядок запроса и убирает повторы.
+    Выбрасывает ValueError при некорректном значении.
+    """
+    if raw_ids is None:
+        raise ValueError('Parameter ids is required')
+
+    if isinstance(raw_ids, str):
+        raw_ids = [part for part in raw_ids.split(',') if part.strip()]
+    elif not isinstance(raw_ids, (list, tuple)):
+        raise ValueError('Parameter ids must be a comma-separated string or a list')
+
+    ids = []
+    seen = set()
+    for raw_id in raw_ids:
+        # Только целые числа и строки из цифр: 1.7 и true не должны превращаться в 1
+        if isinstance(raw_id, int) and not isinstance(raw_id, bool):
+            item_id = raw_id
+        elif isinstance(raw_id, str) and raw_id.strip().isdigit():
+            item_id = int(raw_id.strip())
+        else:
+            raise ValueError(f'Invalid id: {raw_id}')
+        if item_id not in seen:
+            seen.add(item_id)
+            ids.append(item_id)
+
+    if not ids:
+        raise ValueError('Parameter ids is empty')
+    if len(ids) > MAX_BATCH_IDS:
+        raise ValueError(f'Too many ids, maximum is {MAX_BATCH_IDS}')
+
+    return ids
+
+def batch_response(ids, objects):
+    """
+    Формирует ответ пакетного запроса: объекты в порядке запроса,
+    для отсутствующих ID - явная запись об ошибке. objects - модели
+    или уже готовые словари to_dict().
+    """
+    by_id = {}
+    for obj in objects:
+        item = obj if isinstance(obj, dict) else obj.to_dict()
+        by_id[item['id']] = item
+    items = []
+    not_found = []
+    for item_id in ids:
+        item = by_id.get(item_id)
+        if item is None:
+            not_found.append(item_id)
+            items.append({'id': item_id, 'error': 'Not found'})
+        else:
+            items.append(item)
+
+    return {
+        'items': items,
+        'total': len(ids) - len(not_found),
+        'not_found': not_found
+    }
+
+def parse_fields(raw_fields, allowed_fields):
+    """
+    Разбирает параметр ?fields=a,b,c. Возвращает список полей
+    или None, если параметр не указан (нужны все поля).
+    Выбрасывает ValueError при неизвестном поле.
+    """
+    if not raw_fields:
+        return None
+
+    fields = []
+    for field in raw_fields.split(','):
+        field = field.strip()
+        if not field or field in fields:
+            continue
+        if field not in allowed_fields:
+            raise ValueError(f"Unknown field: {field}. Allowed fields: {', '.join(allowed_fields)}")
+        fields.append(field)
+
+    return fields or None
@@ -0,0 +1,382 @@
+"""
+Шардирование записей рабочего времени по отделам.
+
+Шарды - отдельные базы данных, подключенные через SQLALCHEMY_BINDS;
+TIME_RECORD_SHARDS задает их ключи по порядку (переменная окружения
+TIME_RECORD_SHARD_URLS - список URL через запятую, ключи shard0, shard1, ...).
+Таблица time_records живет только на шардах, отделы, сотрудники и календарь -
+на основной базе, а на шарды копируются как справочники (для соединений в отчетах).
+
+Шард сотрудника определяется его отделом: SHARD_DEPARTMENT_MAP сопоставляет
+отделу (или группе отделов одной площадки) ключ шарда, остальные отделы
+распределяются по остатку от деления ID, сотрудники без отдела - на первый шард.
+Каждый шард выдает ID записей из своего диапазона SHARD_ID_BLOCK, поэтому ID
+не пересекаются, а шард записи обычно определяется по ее ID без обращения к базам.
+
+При смене отдела записи сотрудника переезжают на шард нового отдела с теми же ID:
+сначала копируются, затем сохраняется отдел, и только потом записи удаляются
+со старого шарда. Перенесенную запись, которой нет на шарде ее диапазона,
+ищут на остальных шардах. Если перенос прервался, его завершает rebalance.
+
+Запросы к time_records направляет RoutingSession (replica.py) по g.shard.
+Отчеты выполняются на всех шардах параллельно (fan_out) и объединяются.
+
+    python sharding.py prepare      # таблицы, диапазоны ID и справочники на шардах
+    python sharding.py sync         # повторное копирование справочников
+    python sharding.py rebalance    # перенос записей после смены SHARD_DEPARTMENT_MAP
+"""
+import argparse
+import heapq
+import sys
+from concurrent.futures import ThreadPoolExecutor
+from operator import itemgetter
+
+from flask import current_app, g
+from sqlalchemy import func, or_, select, text
+
+from models import db, Department, Employee, TimeRecord, WorkCalendarDay
+
+# Размер диапазона ID записей одного шарда: шард i выдает ID от i * SHARD_ID_BLOCK + 1
+SHARD_ID_BLOCK = 10 ** 12
+
+SHARD_BIND_PREFIX = 'shard'
+
+def shard_binds(urls):
+    """Ключи и URL шардов для SQLALCHEMY_BINDS из списка URL"""
+    return {f'{SHARD_BIND_PREFIX}{index}': url for index, url in enumerate(urls)}
+
+def shard_names():
+    return current_app.config.get('TIME_RECORD_SHARDS') or []
+
+def sharding_enabled():
+    return bool(shard_names())
+
+def shard_for_department(department_id):
+    """Ключ шарда для отдела"""
+    names = shard_names()
+    mapping = current_app.config.get('SHARD_DEPARTMENT_MAP') or {}
+    if department_id is None:
+        return names[0]
+    # Ключи могут прийти из JSON строками
+    shard = mapping.get(department_id, mapping.get(str(department_id)))
+    return shard or names[department_id % len(names)]
+
+def shard_for_employee(employee_id):
+    department_id = db.session.query(Employee.department_id)\
+        .filter(Employee.id == employee_id)\
+        .scalar()
+    return shard_for_department(department_id)
+
+def shard_for_record(record_id):
+    """
+    Ключ шарда, создавшего запись (по диапазону ID), или None, если ID вне
+    диапазонов шардов. Перенесенная запись хранится на другом шарде (locate_record).
+    """
+    names = shard_names()
+    index = (record_id - 1) // SHARD_ID_BLOCK
+    return names[index] if 0 <= index < len(names) else None
+
+def shard_department_filter(column):
+    """
+    Условие на колонку отдела: отделы, записи которых хранятся на шарде текущего
+    запроса (и сотрудники без отдела, если это их шард). Отделов немного, поэтому
+    их шард вычисляется в Python, а сотрудники отбираются в SQL.
+    """
+    department_ids = [
+        department_id for (department_id,) in db.session.query(Department.id)
+        if shard_for_department(department_id) == g.shard
+    ]
+    condition = column.in_(department_ids)
+    if shard_for_department(None) == g.shard:
+        condition = or_(condition, column.is_(None))
+    return condition
+
+def use_employee_shard(employee_id):
+    """Направляет запросы к записям текущего запроса на шард сотрудника"""
+    if sharding_enabled():
+        g.shard = shard_for_employee(employee_id)
+
+def use_record_shard(record_id):
+    """Направляет запросы к записям на шард записи. False, если такой записи быть не может"""
+    if not sharding_enabled():
+        return True
+    shard = shard_for_record(record_id)
+    if shard is None:
+        return False
+    g.shard = shard
+    return True
+
+def _has_record(record_id):
+    return db.session.query(TimeRecord.id).filter(TimeRecord.id == record_id).first() is not None
+
+def locate_record(record_id):
+    """
+    Ищет перенесенную запись на всех шардах и направляет на ее шард запросы
+    текущего запроса. False, если записи нет ни на одном шарде.
+    """
+    names = shard_names()
+    for shard, found in zip(names, fan_out(_has_record, (record_id,), names)):
+        if found:
+            g.shard = shard
+            return True
+    return False
+
+def _next_record_id(shard):
+    """
+    Выражение ID новой записи SQLite-шарда или None, если его выдаст сама база.
+    SQLite выдает max(id) + 1 по всей таблице, а перенесенные записи сохраняют
+    ID из диапазонов других шардов, поэтому следующий ID считается в диапазоне
+    шарда. Максимум вычисляется в самом INSERT под блокировкой записи SQLite,
+    поэтому одновременные вставки не получают одинаковый ID. В PostgreSQL
+    диапазон задает последовательность шарда (prepare).
+    """
+    if db.engines[shard].dialect.name != 'sqlite':
+        return None
+    base = shard_names().index(shard) * SHARD_ID_BLOCK
+    return select(func.coalesce(func.max(TimeRecord.id), base) + 1)\
+        .where(TimeRecord.id > base, TimeRecord.id <= base + SHARD_ID_BLOCK)\
+        .scalar_subquery()
+
+def assign_record_id(record):
+    """Задает ID новой записи из диапазона шарда текущего запроса, если база не выдаст его сама"""
+    shard = g.get('shard')
+    if shard is None:
+        return
+    record.id = _next_record_id(shard)
+
+def fan_out(func, args=(), shards=None):
+    """
+    Выполняет func(*args) на каждом шарде параллельно, все запросы - к базе шарда.
+    Возвращает список результатов в порядке шардов.
+    """
+    app = current_app._get_current_object()
+
+    def run(shard):
+        with app.app_context():
+            g.shard = shard
+            g.shard_only = True
+            try:
+                return func(*args)
+            finally:
+                db.session.remove()
+
+    executor = app.extensions['sharding']
+    return list(executor.map(run, shards or shard_names()))
+
+def collect(func, args=(), department_id=None):
+    """
+    Частичные результаты func(*args): один с основной базы (или реплики) без
+    шардирования, иначе по одному с каждого шарда (с шарда отдела, если он задан).
+    """
+    if not sharding_enabled():
+        return [func(*args)]
+    shards = [shard_for_department(department_id)] if department_id else None
+    return fan_out(func, args, shards)
+
+def keyed_items(query, fields=None, limit=None):
+    """
+    Записи запроса с ключом сортировки check_in: пары (check_in, элемент ответа)
+    для слияния упорядоченных результатов шардов.
+    """
+    query = query.add_columns(TimeRecord.check_in.label('shard_sort_key'))
+    if limit is not None:
+        query = query.limit(limit)
+    items = []
+    for row in query:
+        item = TimeRecord.sparse_dict(row, fields) if fields else row[0].to_dict()
+        items.append((row.shard_sort_key, item))
+    return items
+
+def merge_ordered(parts, reverse=False):
+    """Слияние упорядоченных списков пар (ключ, элемент) в один список элементов"""
+    return [item for _, item in heapq.merge(*parts, key=itemgetter(0), reverse=reverse)]
+
+def _upsert(connection, table, rows):
+    existing = set(connection.execute(select(table.c.id)).scalars())
+    updates = [row for row in rows if row['id'] in existing]
+    inserts = [row for row in rows if row['id'] not in existing]
+    for row in updates:
+        connection.execute(table.update().where(table.c.id == row['id']).values(**row))
+    if inserts:
+        connection.execute(table.insert(), inserts)
+
+def sync_reference_tables(employee_ids=None):
+    """
+    Копирует отделы и сотрудников (или только employee_ids) с основной базы
+    на все шарды, при полном копировании - и календарь. Вызывается после
+    изменения сотрудников.
+    """
+    departments = [dict(row._mapping) for row in db.session.execute(select(Department.__table__))]
+    employees_query = select(Employee.__table__)
+    if employee_ids is not None:
+        employees_query = employees_query.where(Employee.__table__.c.id.in_(employee_ids))
+    employees = [dict(row._mapping) for row in db.session.execute(employees_query)]
+    calendar = None
+    if employee_ids is None:
+        calendar = [dict(row._mapping) for row in db.session.execute(select(WorkCalendarDay.__table__))]
+
+    for shard in shard_names():
+        with db.engines[shard].begin() as connection:
+            _upsert(connection, Department.__table__, departments)
+            _upsert(connection, Employee.__table__, employees)
+            if calendar is not None:
+                # Календарь перезаписывается целиком: на него никто не ссылается
+                connection.execute(WorkCalendarDay.__table__.delete())
+                if calendar:
+                    connection.execute(WorkCalendarDay.__table__.insert(), calendar)
+
+def _copy_records(employee_id, source, target):
+    """
+    Копирует записи сотрудника с шарда source на target с теми же ID. Записи,
+    которые уже есть на target, не перезаписываются. Возвращает (ID всех записей
+    сотрудника на source, ID скопированных).
+    """
+    table = TimeRecord.__table__
+    with db.engines[source].connect() as source_connection:
+        rows = [
+            dict(row._mapping)
+            for row in source_connection.execute(select(table).where(table.c.employee_id == employee_id))
+        ]
+    if not rows:
+        return [], []
+
+    with db.engines[target].begin() as target_connection:
+        existing = set(target_connection.execute(
+            select(table.c.id).where(table.c.employee_id == employee_id)
+        ).scalars())
+        new_rows = [row for row in rows if row['id'] not in existing]
+        if new_rows:
+            target_connection.execute(table.insert(), new_rows)
+    return [row['id'] for row in rows], [row['id'] for row in new_rows]
+
+def _delete_records(shard, record_ids, batch_size=500):
+    table = TimeRecord.__table__
+    with db.engines[shard].begin() as connection:
+        for start in range(0, len(record_ids), batch_size):
+            connection.execute(table.delete().where(table.c.id.in_(record_ids[start:start + batch_size])))
+
+def copy_employee_records(employee_id, previous_department_id, department_id):
+    """
+    Первый шаг переноса при смене отдела, до сохранения нового отдела: копирует
+    записи сотрудника на шард нового отдела. Возвращает (шард, ID скопированных
+    записей) для discard_copied_records или None, если шард не меняется.
+    """
+    if not sharding_enabled():
+        return None
+    source = shard_for_department(previous_department_id)
+    target = shard_for_department(department_id)
+    if source == target:
+        return None
+    _, copied = _copy_records(employee_id, source, target)
+    return target, copied
+
+def discard_copied_records(copied):
+    """Удаляет копии записей, если новый отдел так и не был сохранен"""
+    if not copied:
+        return
+    target, record_ids = copied
+    try:
+        _delete_records(target, record_ids)
+    except Exception as e:
+        # Лишние копии на чужом шарде уберет rebalance
+        print(f"Не удалось удалить копии записей с {target}: {str(e)}; запустите python sharding.py rebalance")
+
+def move_employee_records(employee_id, source, target):
+    """
+    Переносит записи сотрудника между шардами с сохранением ID: докопирует
+    на target записи, которых там нет, и удаляет с source скопированное.
+    Повторный вызов после сбоя безопасен. Возвращает число удаленных с source записей.
+    """
+    record_ids, _ = _copy_records(employee_id, source, target)
+    _delete_records(source, record_ids)
+    return len(record_ids)
+
+def on_employee_changed(employee_id, previous_department_id=None, department_id=None):
+    """
+    Обновляет справочник на шардах после сохранения сотрудника; при смене шарда
+    завершает перенос записей (см. copy_employee_records).
+    """
+    if not sharding_enabled():
+        return
+    sync_reference_tables([employee_id])
+    source = shard_for_department(previous_department_id)
+    target = shard_for_department(department_id)
+    moved = move_employee_records(employee_id, source, target) if source != target else 0
+    if moved:
+        print(f"Сотрудник {employee_id}: {moved} записей перенесено с {source} на {target}")
+
+def prepare_shards():
+    """Создает таблицы на шардах, задает диапазоны ID и копирует справочники"""
+    for index, shard in enumerate(shard_names()):
+        engine = db.engines[shard]
+        db.metadata.create_all(bind=engine)
+        if index and engine.dialect.name == 'postgresql':
+            with engine.begin() as connection:
+                # Перенесенные записи могут иметь ID из чужих диапазонов - берем максимум своего
+                connection.execute(text(
+                    "SELECT setval(pg_get_serial_sequence('time_records', 'id'), "
+                    "GREATEST(COALESCE(MAX(id), 0), :base)) FROM time_records "
+                    "WHERE id > :base AND id <= :base + :block"
+                ), {'base': index * SHARD_ID_BLOCK, 'block': SHARD_ID_BLOCK})
+    sync_reference_tables()
+
+def rebalance():
+    """
+    Переносит записи сотрудников, оказавшиеся не на своем шарде (после смены
+    SHARD_DEPARTMENT_MAP или прерванного переноса при смене отдела)
+    """
+    departments = dict(db.session.query(Employee.id, Employee.department_id))
+    moved = 0
+    for source in shard_names():
+        with db.engines[source].connect() as connection:
+            employee_ids = connection.execute(
+                select(TimeRecord.__table__.c.employee_id).distinct()
+            ).scalars().all()
+        for employee_id in employee_ids:
+            target = shard_for_department(departments.get(employee_id))
+            if target != source:
+                moved += move_employee_records(employee_id, source, target)
+    return moved
+
+def init_sharding(app):
+    """Проверяет конфигурацию шардов и создает пул для параллельных запросов"""
+    names = app.config.get('TIME_RECORD_SHARDS') or []
+    if not names:
+        return False
+
+    binds = app.config.get('SQLALCHEMY_BINDS') or {}
+    missing = [name for name in names if name not in binds]
+    if missing:
+        raise ValueError(f"Shards are not in SQLALCHEMY_BINDS: {', '.join(missing)}")
+    unknown = set((app.config.get('SHARD_DEPARTMENT_MAP') or {}).values()) - set(names)
+    if unknown:
+        raise ValueError(f"SHARD_DEPARTMENT_MAP refers to unknown shards: {', '.join(sorted(unknown))}")
+
+    workers = app.config.get('SHARD_FANOUT_WORKERS', 2 * len(names))
+    app.extensions['sharding'] = ThreadPoolExecutor(max_workers=workers, thread_name_prefix='shard')
+    return True
+
+def main(argv=None):
+    from app import create_app
+
+    parser = argparse.ArgumentParser(description='Обслуживание шардов записей рабочего времени')
+    parser.add_argument('command', choices=['prepare', 'sync', 'rebalance'])
+    args = parser.parse_args(argv)
+
+    app = create_app()
+    with app.app_context():
+        if not sharding_enabled():
+            print("Шардирование не настроено (TIME_RECORD_SHARD_URLS)")
+            return 1
+        if args.command == 'prepare':
+            prepare_shards()
+            print(f"Шарды подготовлены: {', '.join(shard_names())}")
+        elif args.command == 'sync':
+            sync_reference_tables()
+            print("Справочники скопированы на шарды")
+        else:
+            print(f"Перенесено записей: {rebalance()}")
+    return 0
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,34 @@
+import pytest
+
+from app import create_app
+from models import db
+
+@pytest.fixture
+def make_app(tmp_path):
+    """Фабрика приложений на файлах SQLite во временном каталоге"""
+    apps = []
+
+    def factory(config=None):
+        app = create_app({
+            'TESTING': True,
+            'SQLALCHEMY_DATABASE_URI': f"sqlite:///{tmp_path / 'primary.db'}",
+            'SQLALCHEMY_BINDS': {},
+            'TIME_RECORD_SHARDS': [],
+            'SHARD_DEPARTMENT_MAP': {},
+            'REPORT_JOBS_DIR': str(tmp_path / 'report_jobs'),
+            'IDEMPOTENCY_BACKEND': 'memory',
+            'PROFILING_ENABLED': False,
+            'ANALYTICS_ENABLED': False,
+            **(config or {}),
+        })
+        with app.app_context():
+            db.create_all(bind_key=None)
+        apps.append(app)
+        return app
+
+    yield factory
+
+    for app in apps:
+        with app.app_context():
+            for engine in db.engines.values():
+                engine.dispose()
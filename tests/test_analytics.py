@@ -0,0 +1,70 @@
+"""Колоночная аналитика: дочитывание изменений и сверка с SQL"""
+from datetime import datetime, timedelta
+
+import pytest
+
+from analytics import ColumnarStore, verify
+from models import db, Department, Employee, TimeRecord
+
+START = datetime(2024, 1, 1)
+END = datetime(2024, 1, 31, 23, 59, 59)
+
+@pytest.fixture
+def app(make_app):
+    app = make_app()
+    with app.app_context():
+        db.session.add_all([Department(name='IT'), Department(name='Sales')])
+        db.session.flush()
+        for i in range(1, 5):
+            db.session.add(Employee(first_name=f'Name{i}', last_name='S', email=f'e{i}@example.com',
+                                    position='p', department_id=i % 2 + 1))
+        db.session.flush()
+        for day in range(10):
+            for employee_id in range(1, 5):
+                check_in = START + timedelta(days=day, hours=9, minutes=employee_id)
+                db.session.add(TimeRecord(employee_id=employee_id, check_in=check_in,
+                                          check_out=check_in + timedelta(hours=8)))
+        db.session.commit()
+    return app
+
+@pytest.fixture
+def store(app):
+    with app.app_context():
+        store = ColumnarStore()
+        store.load()
+        yield store
+
+def test_load_matches_sql(store):
+    assert len(store) == 40
+    assert verify(store, START, END) == []
+
+def test_late_commit_is_picked_up(store):
+    # Запись получила updated_at раньше прошлой синхронизации, но зафиксирована позже нее
+    synced_at = store.records_synced_at
+    record = TimeRecord.query.filter_by(employee_id=2).order_by(TimeRecord.id).first()
+    record.check_out = record.check_in + timedelta(hours=3)
+    db.session.flush()
+    record.updated_at = synced_at - timedelta(seconds=5)
+    db.session.commit()
+
+    store.refresh()
+    assert verify(store, START, END) == []
+
+def test_deleted_records_dropped(store):
+    TimeRecord.query.filter_by(employee_id=3).delete()
+    db.session.commit()
+
+    store.refresh()
+    assert len(store) == 30
+    assert verify(store, START, END) == []
+
+def test_department_move_and_new_records(store):
+    employee = db.session.get(Employee, 1)
+    employee.department_id = 1
+    check_in = START + timedelta(days=20, hours=9)
+    db.session.add(TimeRecord(employee_id=1, check_in=check_in, check_out=check_in + timedelta(hours=6)))
+    db.session.commit()
+
+    store.refresh()
+    assert len(store) == 41
+    assert verify(store, START, END) == []
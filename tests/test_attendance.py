@@ -0,0 +1,43 @@
+"""Отчет о пропусках: дата приема и общий календарь"""
+from datetime import date, datetime
+
+import pytest
+from sqlalchemy.exc import IntegrityError
+
+from attendance import build_calendar, find_gaps, save_calendar
+from models import db, Employee, WorkCalendarDay
+
+# Пн 2024-01-15 - пт 2024-01-19
+START = date(2024, 1, 15)
+END = date(2024, 1, 19)
+
+@pytest.fixture
+def app(make_app):
+    app = make_app()
+    with app.app_context():
+        save_calendar(build_calendar(START, END), START, END)
+        yield app
+
+def add_employee(email, **fields):
+    employee = Employee(first_name='A', last_name='B', email=email, position='p', **fields)
+    db.session.add(employee)
+    db.session.commit()
+    return employee
+
+def absent_days(employee_id):
+    return [gap['date'] for gap in find_gaps(START, END) if gap['employee_id'] == employee_id]
+
+def test_days_before_hire_date_skipped(app):
+    # Сотрудник заведен раньше периода, но принят в среду
+    employee = add_employee('a@example.com', hired_at=date(2024, 1, 17), created_at=datetime(2024, 1, 1))
+    assert absent_days(employee.id) == ['2024-01-17', '2024-01-18', '2024-01-19']
+
+def test_created_at_used_without_hire_date(app):
+    employee = add_employee('b@example.com', created_at=datetime(2024, 1, 18, 6))
+    assert absent_days(employee.id) == ['2024-01-18', '2024-01-19']
+
+def test_one_common_calendar_row_per_date(app):
+    row = build_calendar(START, START)[0]
+    with pytest.raises(IntegrityError):
+        db.session.execute(WorkCalendarDay.__table__.insert(), [row])
+    db.session.rollback()
@@ -0,0 +1,52 @@
+"""Idempotency-Key: повтор ответа, запрос в процессе (409) и другое тело (422)"""
+import pytest
+
+from idempotency import IDEMPOTENCY_HEADER, REPLAYED_HEADER, request_fingerprint
+from models import db, Employee, TimeRecord
+
+@pytest.fixture(params=['memory', 'sqlite'])
+def app(request, make_app, tmp_path):
+    app = make_app({'IDEMPOTENCY_BACKEND': request.param,
+                    'IDEMPOTENCY_SQLITE_PATH': str(tmp_path / 'idempotency.db')})
+    with app.app_context():
+        db.session.add(Employee(first_name='A', last_name='B', email='a@example.com', position='p'))
+        db.session.commit()
+    return app
+
+def check_in(client, key, body):
+    return client.post('/api/time-records/', data=body, content_type='application/json',
+                       headers={IDEMPOTENCY_HEADER: key})
+
+def record_count(app):
+    with app.app_context():
+        return TimeRecord.query.count()
+
+def test_repeat_returns_saved_response(app):
+    client = app.test_client()
+    first = check_in(client, 'k1', '{"employee_id": 1, "check_in": "2024-01-15T09:00:00"}')
+    assert first.status_code == 201
+    # Тот же JSON с другим порядком ключей и без пробелов - тот же запрос
+    repeat = check_in(client, 'k1', '{"check_in":"2024-01-15T09:00:00","employee_id":1}')
+    assert repeat.status_code == 201
+    assert repeat.headers[REPLAYED_HEADER] == 'true'
+    assert repeat.get_json() == first.get_json()
+    assert record_count(app) == 1
+
+def test_same_key_with_different_body_rejected(app):
+    client = app.test_client()
+    assert check_in(client, 'k2', '{"employee_id": 1, "check_in": "2024-01-15T09:00:00"}').status_code == 201
+    response = check_in(client, 'k2', '{"employee_id": 1, "check_in": "2024-01-15T10:00:00"}')
+    assert response.status_code == 422
+    assert record_count(app) == 1
+
+def test_request_in_progress_conflict(app):
+    body = '{"employee_id": 1}'
+    # Первый запрос зарезервировал ключ, но еще не сохранил ответ
+    with app.test_request_context('/api/time-records/', method='POST', data=body,
+                                  content_type='application/json'):
+        fingerprint = request_fingerprint()
+    app.extensions['idempotency'].reserve('POST /api/time-records/ k3', fingerprint)
+
+    response = check_in(app.test_client(), 'k3', body)
+    assert response.status_code == 409
+    assert record_count(app) == 0
@@ -0,0 +1,109 @@
+"""Правила расчёта payroll.py: сверхурочные, ночные часы, отдых между сменами"""
+from datetime import datetime, timedelta
+
+import pytest
+
+from payroll import DEFAULT_PAYROLL_RULES, build_rules, compute_employee_payroll, night_seconds, parse_period_end
+
+RULES = DEFAULT_PAYROLL_RULES
+
+def shift(day, start_hour, hours):
+    check_in = datetime(2024, 1, day, start_hour)
+    return check_in, check_in + timedelta(hours=hours)
+
+# night_seconds
+
+def test_night_seconds_day_shift():
+    assert night_seconds(datetime(2024, 1, 1, 9), datetime(2024, 1, 1, 18), RULES) == 0
+
+def test_night_seconds_shift_across_midnight():
+    # 20:00 - 04:00: ночью с 22:00 до 04:00
+    assert night_seconds(datetime(2024, 1, 1, 20), datetime(2024, 1, 2, 4), RULES) == 6 * 3600
+
+def test_night_seconds_early_morning_shift():
+    # 04:00 - 12:00: захватывает конец ночи, начавшейся накануне
+    assert night_seconds(datetime(2024, 1, 1, 4), datetime(2024, 1, 1, 12), RULES) == 2 * 3600
+
+def test_night_seconds_long_shift_covers_two_nights():
+    # 05:00 - 23:00: час прошлой ночи и час следующей
+    assert night_seconds(datetime(2024, 1, 1, 5), datetime(2024, 1, 1, 23), RULES) == 2 * 3600
+
+def test_night_seconds_window_within_day():
+    rules = build_rules({'night_start_hour': 1, 'night_end_hour': 5})
+    assert night_seconds(datetime(2024, 1, 1, 0), datetime(2024, 1, 1, 8), rules) == 4 * 3600
+
+# compute_employee_payroll
+
+def test_regular_week_without_overtime():
+    # Понедельник - пятница 2024-01-01..05 по 8 часов
+    result = compute_employee_payroll(1, [shift(day, 9, 8) for day in range(1, 6)], RULES)
+    assert result['shift_count'] == 5
+    assert result['worked_hours'] == 40
+    assert result['regular_hours'] == 40
+    assert result['overtime_hours'] == 0
+    assert result['night_hours'] == 0
+    assert result['rest_violation_count'] == 0
+
+def test_daily_overtime():
+    result = compute_employee_payroll(1, [shift(1, 8, 10)], RULES)
+    assert result['regular_hours'] == 8
+    assert result['daily_overtime_hours'] == 2
+    assert result['weekly_overtime_hours'] == 0
+
+def test_daily_overtime_sums_shifts_of_one_day():
+    result = compute_employee_payroll(1, [shift(1, 6, 5), shift(1, 18, 5)], RULES)
+    assert result['daily_overtime_hours'] == 2
+    # Между сменами 7 часов отдыха - меньше 11
+    assert result['rest_violation_count'] == 1
+    assert result['rest_violations'][0]['rest_hours'] == 7
+
+def test_weekly_overtime_counts_regular_hours_only():
+    # Шесть дней по 9 часов: 6 часов дневных сверхурочных, 48 - 40 = 8 недельных
+    result = compute_employee_payroll(1, [shift(day, 8, 9) for day in range(1, 7)], RULES)
+    assert result['daily_overtime_hours'] == 6
+    assert result['weekly_overtime_hours'] == 8
+    assert result['regular_hours'] == 40
+    assert result['overtime_hours'] == 14
+
+def test_weekly_limit_resets_on_monday():
+    # Пятница - суббота 5-6 января и понедельник 8 января, по 8 часов
+    result = compute_employee_payroll(1, [shift(5, 9, 8), shift(6, 9, 8), shift(8, 9, 8)],
+                                      build_rules({'weekly_regular_hours': 10}))
+    # Первая неделя: 16 - 10 = 6 сверхурочных, вторая в пределах нормы
+    assert result['weekly_overtime_hours'] == 6
+    assert result['regular_hours'] == 18
+
+def test_night_shift_belongs_to_start_day():
+    result = compute_employee_payroll(1, [shift(1, 22, 10)], RULES)
+    assert result['night_hours'] == 8
+    assert result['daily_overtime_hours'] == 2
+
+def test_rest_violation_between_days():
+    result = compute_employee_payroll(1, [shift(1, 14, 8), shift(2, 6, 8)], RULES)
+    assert result['rest_violation_count'] == 1
+    assert result['rest_violations'][0] == {
+        'previous_check_out': '2024-01-01T22:00:00',
+        'check_in': '2024-01-02T06:00:00',
+        'rest_hours': 8.0,
+    }
+
+def test_open_records_are_skipped():
+    records = [shift(1, 9, 8), (datetime(2024, 1, 2, 9), None)]
+    result = compute_employee_payroll(1, records, RULES)
+    assert result['shift_count'] == 1
+    assert result['worked_hours'] == 8
+
+def test_no_records():
+    result = compute_employee_payroll(7, [], RULES)
+    assert result['employee_id'] == 7
+    assert result['shift_count'] == 0
+    assert result['worked_hours'] == 0
+
+# parse_period_end
+
+@pytest.mark.parametrize('value, expected', [
+    ('2024-01-31', datetime(2024, 1, 31, 23, 59, 59, 999999)),
+    ('2024-01-31T12:30:00', datetime(2024, 1, 31, 12, 30)),
+])
+def test_parse_period_end(value, expected):
+    assert parse_period_end(value) == expected
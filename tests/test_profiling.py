@@ -0,0 +1,36 @@
+"""Профилирование по токену: один профилируемый запрос на процесс"""
+import pytest
+
+from profiling import PROFILE_HEADER, PROFILE_ID_HEADER, _profile_lock
+
+@pytest.fixture
+def client(make_app, tmp_path):
+    app = make_app({'PROFILING_ENABLED': True, 'PROFILING_SECRET': 'secret',
+                    'PROFILING_DIR': str(tmp_path / 'profiles')})
+    return app.test_client()
+
+def test_profiled_request(client):
+    response = client.get('/api/departments', headers={PROFILE_HEADER: 'secret'})
+    assert response.status_code == 200
+    profile_id = response.headers[PROFILE_ID_HEADER]
+    profile = client.get(f'/api/admin/profiles/{profile_id}', headers={PROFILE_HEADER: 'secret'})
+    assert profile.get_json()['sql_count'] == 1
+    assert not _profile_lock.locked()
+
+def test_request_during_other_profile_is_not_profiled(client):
+    with _profile_lock:
+        response = client.get('/api/departments', headers={PROFILE_HEADER: 'secret'})
+    assert response.status_code == 200
+    assert PROFILE_ID_HEADER not in response.headers
+
+def test_lock_released_when_view_fails(make_app, tmp_path):
+    app = make_app({'PROFILING_ENABLED': True, 'PROFILING_SECRET': 'secret',
+                    'PROFILING_DIR': str(tmp_path / 'profiles')})
+
+    @app.route('/boom')
+    def boom():
+        raise RuntimeError('boom')
+
+    with pytest.raises(RuntimeError):
+        app.test_client().get('/boom', headers={PROFILE_HEADER: 'secret'})
+    assert not _profile_lock.locked()
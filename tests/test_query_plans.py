@@ -0,0 +1,9 @@
+"""Планы запросов API не хуже эталона query_plans/sqlite.json (см. plan_check.py)"""
+from plan_check import collect_plans, compare, load_baseline
+
+def test_no_plan_regressions():
+    dialect, plans = collect_plans()
+    baseline = load_baseline(dialect)
+    assert baseline is not None, 'Нет эталонных планов, запустите python plan_check.py --update'
+    errors, _ = compare(baseline, plans)
+    assert not errors, '\n'.join(errors)
@@ -0,0 +1,81 @@
+"""Чтение с реплики: read-your-writes и переход на основную базу при ошибках"""
+import sqlite3
+
+import pytest
+from sqlalchemy import event
+from sqlalchemy.exc import OperationalError
+
+from models import db, Department
+from replica import REPLICA_BIND_KEY, _health, prepare_replica
+
+@pytest.fixture
+def app(make_app, tmp_path):
+    app = make_app({'SQLALCHEMY_BINDS': {REPLICA_BIND_KEY: f"sqlite:///{tmp_path / 'replica.db'}"}})
+    with app.app_context():
+        db.session.add(Department(name='Primary'))
+        db.session.commit()
+        prepare_replica()
+    # На реплике то же, но с другим названием: видно, откуда прочитан ответ
+    connection = sqlite3.connect(tmp_path / 'replica.db')
+    connection.execute("UPDATE departments SET name = 'Replica'")
+    connection.commit()
+    connection.close()
+    return app
+
+def department_names(client, **kwargs):
+    return [item['name'] for item in client.get('/api/departments', **kwargs).get_json()['items']]
+
+def replica_engine(app):
+    with app.app_context():
+        return db.engines[REPLICA_BIND_KEY]
+
+def test_reads_go_to_replica(app):
+    assert department_names(app.test_client()) == ['Replica']
+
+def test_primary_forced_by_header_and_parameter(app):
+    client = app.test_client()
+    assert department_names(client, headers={'X-Read-Primary': '1'}) == ['Primary']
+    assert client.get('/api/departments?consistency=primary').get_json()['items'][0]['name'] == 'Primary'
+
+def test_read_your_writes_after_write(app):
+    client = app.test_client()
+    response = client.post('/api/employees/', json={
+        'first_name': 'A', 'last_name': 'B', 'email': 'a@example.com', 'position': 'p'
+    })
+    assert response.status_code == 201
+    assert client.get_cookie('last_write') is not None
+    # Клиент с cookie недавней записи читает с основной базы
+    assert department_names(client) == ['Primary']
+    # Другой клиент по-прежнему читает с реплики
+    assert department_names(app.test_client()) == ['Replica']
+
+def test_query_error_retried_on_primary_without_marking_replica_down(app, tmp_path):
+    connection = sqlite3.connect(tmp_path / 'replica.db')
+    connection.execute('DROP TABLE time_records')
+    connection.commit()
+    connection.close()
+
+    client = app.test_client()
+    assert client.get('/api/reports/daily?date=2024-01-15').status_code == 200
+    available, _ = _health.get(replica_engine(app), (True, None))
+    assert available
+    # Остальные таблицы по-прежнему читаются с реплики
+    assert department_names(client) == ['Replica']
+
+def test_disconnect_marks_replica_down(app):
+    engine = replica_engine(app)
+
+    def disconnect(conn, cursor, statement, parameters, context, executemany):
+        raise OperationalError(statement, parameters, Exception('server closed the connection'),
+                               connection_invalidated=True)
+
+    event.listen(engine, 'before_cursor_execute', disconnect)
+    try:
+        client = app.test_client()
+        assert department_names(client) == ['Primary']
+        available, _ = _health[engine]
+        assert not available
+    finally:
+        event.remove(engine, 'before_cursor_execute', disconnect)
+    # До следующей проверки запросы идут на основную базу без обращения к реплике
+    assert department_names(app.test_client()) == ['Primary']
@@ -0,0 +1,64 @@
+"""Фоновые отчеты: проверка параметров при постановке и выполнение без HTTP-запроса"""
+import time
+from datetime import datetime
+
+import pytest
+
+from models import db, Department, Employee, TimeRecord
+
+@pytest.fixture
+def client(make_app):
+    app = make_app()
+    with app.app_context():
+        department = Department(name='IT')
+        db.session.add(department)
+        db.session.flush()
+        employee = Employee(first_name='A', last_name='B', email='a@example.com',
+                            position='p', department_id=department.id)
+        db.session.add(employee)
+        db.session.flush()
+        db.session.add(TimeRecord(employee_id=employee.id, check_in=datetime(2024, 1, 15, 9),
+                                  check_out=datetime(2024, 1, 15, 17)))
+        db.session.commit()
+    return app.test_client()
+
+def wait_for(client, job_id):
+    for _ in range(200):
+        job = client.get(f'/api/reports/jobs/{job_id}').get_json()
+        if job['status'] not in ('queued', 'running'):
+            return job
+        time.sleep(0.05)
+    raise AssertionError('Job did not finish')
+
+def submit(client, report_type, **params):
+    return client.post('/api/reports/jobs', json={'type': report_type, 'params': params})
+
+def test_missing_dates_rejected_on_submit(client):
+    response = submit(client, 'summary')
+    assert response.status_code == 400
+    assert response.get_json()['error'] == 'Start date and end date are required'
+
+def test_unknown_type_rejected(client):
+    assert submit(client, 'unknown').status_code == 400
+
+def test_json_report_matches_endpoint(client):
+    params = {'start_date': '2024-01-01T00:00:00', 'end_date': '2024-02-01T00:00:00'}
+    response = submit(client, 'summary', **params)
+    assert response.status_code == 202
+    job = wait_for(client, response.get_json()['id'])
+    assert job['status'] == 'done', job['error']
+
+    result = client.get(job['download_url']).get_json()
+    assert result == client.get('/api/reports/summary', query_string=params).get_json()
+    assert result['data'][0]['record_count'] == 1
+
+def test_csv_report_written_as_file(client):
+    response = submit(client, 'export_csv', start_date='2024-01-01T00:00:00',
+                      end_date='2024-02-01T00:00:00')
+    job = wait_for(client, response.get_json()['id'])
+    assert job['status'] == 'done', job['error']
+
+    download = client.get(job['download_url'])
+    assert download.mimetype == 'text/csv'
+    content = download.get_data().decode('utf-8-sig')
+    assert len(content.splitlines()) == 2
@@ -0,0 +1,103 @@
+"""Шардирование записей по отделам на двух файлах SQLite"""
+from concurrent.futures import ThreadPoolExecutor
+
+import pytest
+from flask import g
+
+from models import db, Department, TimeRecord
+from sharding import SHARD_ID_BLOCK, prepare_shards, shard_binds
+
+DATES = ['2024-01-15', '2024-01-16', '2024-01-17']
+
+@pytest.fixture
+def app(make_app, tmp_path):
+    app = make_app({
+        'SQLALCHEMY_BINDS': shard_binds([f"sqlite:///{tmp_path / f'shard{i}.db'}" for i in range(2)]),
+        'TIME_RECORD_SHARDS': ['shard0', 'shard1'],
+        'SHARD_DEPARTMENT_MAP': {'1': 'shard0', '2': 'shard1'},
+    })
+    with app.app_context():
+        db.session.add_all([Department(name='IT'), Department(name='Sales')])
+        db.session.commit()
+        prepare_shards()
+
+    client = app.test_client()
+    # Сотрудники 1 и 2 - в отделе 1 (shard0), сотрудник 3 - в отделе 2 (shard1)
+    for i, department_id in enumerate((1, 1, 2), 1):
+        response = client.post('/api/employees/', json={
+            'first_name': f'Name{i}', 'last_name': 'S', 'email': f'e{i}@example.com',
+            'position': 'p', 'department_id': department_id,
+        })
+        assert response.status_code == 201
+    for employee_id in (1, 2, 3):
+        for day in DATES:
+            record = client.post('/api/time-records/', json={
+                'employee_id': employee_id, 'check_in': f'{day}T09:00:00'
+            }).get_json()
+            response = client.put(f"/api/time-records/{record['id']}",
+                                  json={'check_out': f'{day}T17:00:00'})
+            assert response.status_code == 200
+    return app
+
+def shard_record_ids(app, shard, employee_id):
+    with app.test_request_context():
+        g.shard = shard
+        return sorted(row.id for row in db.session.query(TimeRecord.id).filter_by(employee_id=employee_id))
+
+def employee_record_ids(client, employee_id):
+    items = client.get(f'/api/time-records/?employee_id={employee_id}').get_json()['items']
+    return sorted(item['id'] for item in items)
+
+def test_ids_from_shard_blocks(app):
+    client = app.test_client()
+    assert all(0 < record_id <= SHARD_ID_BLOCK for record_id in employee_record_ids(client, 1))
+    assert all(SHARD_ID_BLOCK < record_id <= 2 * SHARD_ID_BLOCK for record_id in employee_record_ids(client, 3))
+
+def test_concurrent_check_ins_get_distinct_ids(app):
+    def check_in(employee_id):
+        return app.test_client().post('/api/time-records/check-in', json={'employee_id': employee_id})
+
+    with ThreadPoolExecutor(max_workers=2) as executor:
+        responses = list(executor.map(check_in, (1, 2)))
+    assert [response.status_code for response in responses] == [201, 201]
+    ids = {response.get_json()['id'] for response in responses}
+    assert len(ids) == 2
+
+def test_department_move_keeps_ids(app):
+    client = app.test_client()
+    ids = employee_record_ids(client, 3)
+
+    assert client.put('/api/employees/3', json={'department_id': 1}).status_code == 200
+
+    assert shard_record_ids(app, 'shard1', 3) == []
+    assert shard_record_ids(app, 'shard0', 3) == ids
+    assert employee_record_ids(client, 3) == ids
+    # Запись из диапазона shard1 находится на shard0
+    for record_id in ids:
+        response = client.get(f'/api/time-records/{record_id}')
+        assert response.status_code == 200
+        assert response.get_json()['employee_id'] == 3
+
+    # Чужие ID на shard0 не сдвигают выдачу ID в его диапазоне
+    response = client.post('/api/time-records/check-in', json={'employee_id': 1})
+    assert response.status_code == 201
+    assert response.get_json()['id'] <= SHARD_ID_BLOCK
+
+def test_fan_out_reports(app):
+    client = app.test_client()
+    listing = client.get('/api/time-records/?per_page=5').get_json()
+    assert listing['total'] == 9
+    assert listing['pages'] == 2
+    check_ins = [item['check_in'] for item in listing['items']]
+    assert check_ins == sorted(check_ins, reverse=True)
+
+    period = {'start_date': '2024-01-01T00:00:00', 'end_date': '2024-01-31T23:59:59'}
+    by_employee = client.get('/api/reports/summary', query_string={**period, 'group_by': 'employee'}).get_json()
+    assert sorted((item['employee_id'], item['record_count']) for item in by_employee['data']) == \
+        [(1, 3), (2, 3), (3, 3)]
+    by_department = client.get('/api/reports/summary', query_string={**period, 'group_by': 'department'}).get_json()
+    assert sorted((item['department_id'], item['record_count']) for item in by_department['data']) == \
+        [(1, 6), (2, 3)]
+
+    daily = client.get('/api/reports/daily?date=2024-01-16').get_json()
+    assert len(daily['records']) == 3